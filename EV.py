@@ -72,16 +72,32 @@ I chose Python for data processing and analysis due to its robust statistical an
 
 I utilized libraries such as Pandas and NumPy for efficient data manipulation, Matplotlib for plotting graphs, and Seaborn for creating visually appealing and understandable visualizations through bar plots, histograms, and line plots. Additionally, I used curve_fit from the scipy.optimize module to forecast EV registration values, providing a predictive model for the market size analysis.'''
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import time
+
+from ev_aggregate import AGGREGATE_COLUMNS
+from ev_cache import load_cached
+from ev_clean import LazyCleaner
+from ev_geo import GeoCube
+from ev_loader import DATA_FILE
+from ev_range import RangeSummary, plot_range_summary
+from ev_series import SalesSeries, yearly_forecast
+from ev_store import RegistrationStore
+
 
 # In[5]:
 
-# Next we import the 
-EVdata = pd.read_csv('Electric_Vehicle_Title_and_Registration_Activity.csv')
+# Next we import the data, reading only the columns used below with an explicit schema (categoricals and small integers)
+# columns the analyses never read (VIN, DOL Vehicle ID, Odometer Reading, ...) are not loaded, so unlike the original
+# full-file dropna, a row missing only one of those columns is no longer dropped
+# Sale Date and Sale Price for the monthly series at the end are read in the same pass
+# the typed frame is cached in .ev_cache/ and only rebuilt from the CSV when the file changes
+load_start = time.perf_counter()
+EVdata = load_cached(DATA_FILE, AGGREGATE_COLUMNS)
+print(f'Loaded {len(EVdata)} rows in {time.perf_counter() - load_start:.2f}s')
 
 
 # In[6]:
@@ -92,20 +108,16 @@ EVdata.info()
 
 # In[7]:
 
-
-EVdata.isnull().sum()
+#null counts per column, from per-column null bitmaps that are built once and reused below
+cleaner = LazyCleaner(EVdata)
+cleaner.quality_report()
 
 
 # In[8]:
 
-
-EVdata.dropna(inplace = True)
-
-
-# In[9]:
-
-
-EVdata.isnull().sum()
+#instead of a global dropna, each analysis only skips the rows missing one of the columns it reads
+#(value_counts, groupby and mean already leave those rows out); this shows what each analysis keeps
+cleaner.analysis_report()
 
 
 # In[75]:
@@ -141,13 +153,18 @@ plt.show()
 # In[10]:
 
 
-EVdata['County'].value_counts()
+# one groupby builds a County / City x vehicle type x Model Year cube; the county ranks, top cities and their split by
+# vehicle type below are slices of it, with the top k picked by partial selection instead of a full sort. The county
+# ranks and top cities use the cube's exact County and County / City totals, so rows missing a vehicle type, Model
+# Year or City still count
+geo = GeoCube.from_frame(EVdata)
+geo.county_ranks()
 
 
 # In[11]:
 
 
-Distribution = EVdata.groupby(['County', 'City']).size().sort_values(ascending=False).reset_index(name='Count').head(10)
+Distribution = geo.top_cities(10)
 Distribution 
 
 
@@ -165,6 +182,13 @@ plt.xticks(rotation=45)
 plt.show()
 
 #Overall, the graph indicates that EV adoption is not uniform across the cities and is more concentrated in certain areas, particularly in King County.
+
+# In[12]:
+
+#the top 3 cities of every county, and the top 10 cities split by vehicle type
+geo.top_cities_per_county(3)
+
+geo.vehicle_type_breakdown(10)
 # In[13]:
 
 '''Next, let’s explore the types of electric vehicles represented in this dataset. Understanding the breakdown between different EV types, such as Battery Electric Vehicles (BEV) and Plug-in Hybrid Electric Vehicles (PHEV), can provide insights into consumer preferences and the adoption patterns of purely electric vs. hybrid electric solutions. So, let’s visualize the distribution of electric vehicle types to see which categories are most popular among the registered vehicles:'''
@@ -243,14 +267,17 @@ Top_5_manufacturers
 # In[21]:
 
 
-Top_5_Productions_df = EVdata[EVdata['Make'].isin(Top_5_manufacturers)]
-Top_5_Productions_df
+# instead of copying the matching rows into a new frame, keep the key columns as integer codes with prebuilt
+# group indexes and select the rows of the top 5 makes as an index lookup
+store = RegistrationStore.from_frame(EVdata).build_indexes()
+Top_5_rows = store.rows('Make', Top_5_manufacturers)
+len(Top_5_rows)
 
 
 # In[22]:
 '''Next, let’s drill down into the most popular models within these top manufacturers to get a more detailed understanding of consumer preferences at the model level:'''
 
-Top_models = Top_5_Productions_df.groupby(['Make','Model']).size().sort_values(ascending = False).reset_index(name = 'Count').head(10)
+Top_models = store.counts(['Make','Model'], Top_5_rows).sort_values(ascending = False).reset_index(name = 'Count').head(10)
 Top_models
 
 
@@ -270,13 +297,11 @@ plt.show()
 # In[24]:
 '''Next, we’ll explore the electric range of vehicles, which is a critical factor for analyzing the market size of electric vehicles. The electric range indicates how far an EV can travel on a single charge, and advancements in battery technology have been steadily increasing these ranges over the years. So, let’s look at the distribution of electric ranges in the dataset and identify any notable trends, such as improvements over time or variations between different vehicle types or manufacturers:'''
 
+# summarise the column once (per-mile counts and running moments), the histogram, KDE and mean are drawn from the summary
+Range_summary = RangeSummary.from_values(EVdata['Electric Range'])
+
 plt.figure(figsize =(12,6))
-sns.histplot(EVdata['Electric Range'],bins = 20, kde= True, color = 'royalblue')
-plt.title('Distribution of Electric Vehicle Ranges')
-plt.xlabel("Electric Range(miles)")
-plt.ylabel("Number of vehicles") 
-plt.axvline(EVdata['Electric Range'].mean(), color = 'red', linestyle ='--', label = f'Mean Range: {EVdata["Electric Range"].mean():.2f} miles')
-plt.legend()
+plot_range_summary(Range_summary, bins = 20, color = 'royalblue')
 plt.show()
 
 '''The above graph shows the mean electric range. Key observations from the graph include:
@@ -324,7 +349,7 @@ The data suggest that while there have been fluctuations, the overall trend over
 
 Next, let’s explore how electric ranges vary among the top manufacturers and models. This analysis can reveal how different manufacturers are addressing the crucial aspect of electric range and highlight which models stand out for their superior range capabilities:'''
 
-avg_range_by_manufacturers = Top_5_Productions_df.groupby(['Make','Model'])['Electric Range'].mean().sort_values(ascending = False).reset_index(name = 'Range in miles')
+avg_range_by_manufacturers = store.mean('Electric Range', ['Make','Model'], Top_5_rows).sort_values(ascending = False).reset_index(name = 'Range in miles')
 avg_range_by_manufacturers
 
 
@@ -370,14 +395,20 @@ EV_registration_counts
 # In[36]:
 
 
-from scipy.optimize import curve_fit
+from ev_forecast import Forecaster, bootstrap_forecast
+
+# the model ('exponential', 'logistic' or 'cagr'), the first incomplete year and the number of years to forecast
+FORECAST_MODEL = 'exponential'
+CUTOFF_YEAR = 2024
+HORIZON = 6
+forecaster = Forecaster(FORECAST_MODEL, cutoff = CUTOFF_YEAR, horizon = HORIZON)
 
 
 # In[70]:
 
 
 # filter the dataset to include years with complete data, assuming 2023 is the last complete year
-filtered_years = EV_registration_counts[EV_registration_counts.index < 2024]
+filtered_years = forecaster.training_data(EV_registration_counts)
 filtered_years
 
 '''The dataset provides the number of electric vehicles registered each year from 1997 through 2024. However, the data for 2024 is incomplete as it only contains the data till March. Here’s a summary of EV registrations for recent years:
@@ -392,18 +423,13 @@ We’ll calculate the Compound Annual Growth Rate (CAGR) between a recent year w
 # In[71]:
 
 
-# define a function for exponential growth to fit the data
-def exp_growth(x, a, b):
-    return a * np.exp(b * x)
-
-# prepare the data for curve fitting
-# here the curve_fit function uses the non-linear least squares to fit a function, f, to data.
-x_data = filtered_years.index - filtered_years.index.min()
-y_data = filtered_years.values
-
+# fit the model (for 'exponential' this is exp_growth, a * exp(b * x)) to the complete years
+# the exponential fit is the same non-linear least squares fit curve_fit does, x counts years from the first year
+# fits are memoized, so re-running the cells below with another HORIZON does not refit
+fit = forecaster.fit(EV_registration_counts)
 
 #Params -> This is an array of the optimized parameters (in this case, a and b) that best fit the data according to the model you provided (exp_growth).
-params, covariance = curve_fit(exp_growth, x_data, y_data)
+params, covariance = fit.params, fit.covariance
 #The covariance matrix is used to assess the accuracy and precision of the fitted parameters obtained from the curve fitting process. 
 #It provides valuable information about the potential errors and the correlation between parameters, which is crucial for interpreting the results of the curve fitting and understanding the reliability of the model.
 #If the diagonal values are small, it suggests that the fitted parameters are precise; if large, the parameters might have significant uncertainty.
@@ -415,21 +441,32 @@ print(params)
 
 
 # use the fitted function to forecast the number of EVs for 2024 and the next five years
-forecasted_years = np.arange(2024, 2024+6) - filtered_years.index.min()
-forecasted_values = exp_growth(forecasted_years, *params)
+forecasted_values = forecaster.forecast(EV_registration_counts)
 
 # create a dictionary to display the forecasted values for easier interpretation
-forecasted_growth = dict(zip(forecasted_years + filtered_years.index.min(), forecasted_values))
+forecasted_growth = forecasted_values.to_dict()
 forecasted_growth
 
 
+# In[ ]:
+
+
+# 95% prediction interval around the forecast from 10,000 residual bootstrap resamples (exponential model only)
+# this script has no __main__ guard for worker processes to import safely, so the resamples are fitted in process
+# (a fraction of a second); scheduled jobs can pass workers=None to spread them over every core
+SHOW_INTERVALS = FORECAST_MODEL == 'exponential'
+if SHOW_INTERVALS:
+    forecast_intervals = bootstrap_forecast(forecaster, EV_registration_counts, resamples = 10000, level = 0.95, workers = 1)
+    print(forecast_intervals)
+
+
 # In[73]:
 
 
 #let's plot the graph for the above data
-years = np.arange(filtered_years.index.min(), 2029+1)
+years = np.arange(filtered_years.index.min(), forecaster.horizon_years[-1]+1)
 actual_years = filtered_years.index
-forecasted_years_full = np.arange(2024, 2029+1)
+forecasted_years_full = forecaster.horizon_years
 
 actual_values = filtered_years.values
 forecasted_values_full = [forecasted_growth[year] for year in forecasted_years_full]
@@ -437,6 +474,8 @@ forecasted_values_full = [forecasted_growth[year] for year in forecasted_years_f
 plt.figure(figsize = (12,6))
 plt.plot(actual_years, actual_values, 'bo-', label = 'Actual Registrations')
 plt.plot(forecasted_years_full, forecasted_values_full, 'ro--', label = 'Forecasted Registrations')
+if SHOW_INTERVALS:
+    plt.fill_between(forecasted_years_full, forecast_intervals['lower'], forecast_intervals['upper'], color = 'red', alpha = 0.2, label = '95% prediction interval')
 
 plt.title('Current and estimated EV market size')
 plt.xlabel("Year")
@@ -456,6 +495,40 @@ plt.show()
 
 '''Given the growing trend in actual EV registrations and the projected acceleration as per the forecast data, we can conclude that the EV market size is expected to expand considerably. The steep increase in forecasted registrations suggests that consumer adoption of EVs is on the rise, and this trend is likely to continue. Overall, the data point towards a promising future for the EV industry, indicating a significant shift in consumer preferences and a potential increase in related investment and business opportunities.'''
 
+# In[ ]:
+
+# Model Year counts are only a proxy for when vehicles were registered; the Sale Date of every registration gives the
+# actual registrations (and Sale Price the revenue) per month and per week. Sale Date is parsed once per distinct
+# date into int32 day numbers and the series are bincounts over those days.
+sales = SalesSeries.from_frame(EVdata)
+Monthly_sales = sales.monthly()
+Weekly_sales = sales.weekly()
+Monthly_sales.tail(12)
+
+
+# In[ ]:
+
+
+fig, axes = plt.subplots(2, 1, figsize = (12,8), sharex = True)
+axes[0].plot(Monthly_sales.index.to_timestamp(), Monthly_sales['registrations'], color = 'royalblue')
+axes[0].set_ylabel('Registrations per month')
+axes[1].plot(Monthly_sales.index.to_timestamp(), Monthly_sales['revenue'] / 1e6, color = 'green')
+axes[1].set_ylabel('Sale Price total (million $)')
+axes[1].set_xlabel('Sale Date')
+axes[0].set_title('Monthly EV registrations and revenue')
+plt.tight_layout()
+plt.show()
+
+
+# In[ ]:
+
+
+# the same model fitted to the complete months of Sale Date: the months already in the data count as observed and
+# the rest of the incomplete year is predicted by the fit, so 2024 is neither dropped nor taken at face value
+Sales_forecast = yearly_forecast(sales, forecaster)
+Sales_forecast.tail(HORIZON + 3)
+
+
 #Share Phase:
 
 '''So, market size analysis is a crucial aspect of market research that determines the potential sales volume within a given market. It helps businesses understand the magnitude of demand, assess market saturation levels, and identify growth opportunities. From our market size analysis of electric vehicles, we found a promising future for the EV industry, indicating a significant shift in consumer preferences and a potential increase in related investment and business opportunities.'''
@@ -0,0 +1,193 @@
+#Single pass aggregation of every count / mean report in EV.py
+
+'''EV.py scans the full frame once per report (Model Year counts twice, County, County/City, vehicle types, Make,
+Make/Model and the mean range by Model Year). RegistrationAggregator keeps one counter or sum/count accumulator per
+report and fills all of them from the same chunk, so the CSV is read once, in chunks, and memory stays bounded by
+the chunk size plus the (small) group tables. reports() then returns the same tables the notebook cells produce.'''
+
+import pandas as pd
+
+from ev_geo import top_k
+from ev_loader import (ANALYSIS_COLUMNS, DATA_FILE, RANGE, SALE_DATE, SERIES_COLUMNS, VEHICLE_TYPE, YEAR,
+                       load_registrations)
+from ev_range import RangeSummary
+from ev_series import SalesSeries
+
+
+# columns read by the streaming readers, the Sale Date series are built in the same pass
+AGGREGATE_COLUMNS = ANALYSIS_COLUMNS + SERIES_COLUMNS
+
+# group keys counted in every chunk
+COUNT_KEYS = {
+    'year': [YEAR],
+    'county': ['County'],
+    'county_city': ['County', 'City'],
+    'vehicle_type': [VEHICLE_TYPE],
+    'make': ['Make'],
+    'make_model': ['Make', 'Model'],
+    # per series yearly counts for the batch forecaster
+    'county_year': ['County', YEAR],
+    'make_year': ['Make', YEAR],
+    'vehicle_type_year': [VEHICLE_TYPE, YEAR],
+    # County / City x vehicle type x Model Year, reshaped into an ev_geo.GeoCube
+    'geo': ['County', 'City', VEHICLE_TYPE, YEAR],
+}
+# group keys with a running Electric Range sum and count of the rows that have a range
+RANGE_SUM_KEYS = {
+    'year': [YEAR],
+    'make_model': ['Make', 'Model'],
+    'vehicle_type_year': [VEHICLE_TYPE, YEAR],
+}
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def _plain_index(series):
+    # categorical levels differ from chunk to chunk, plain labels let the partial tables add up
+    index = series.index
+    if isinstance(index, pd.MultiIndex):
+        series.index = index.set_levels([level.astype(object) if isinstance(level, pd.CategoricalIndex) else level
+                                         for level in index.levels])
+    elif isinstance(index, pd.CategoricalIndex):
+        series.index = index.astype(object)
+    return series
+
+
+def _add(total, part):
+    if total is None:
+        return part
+    return total.add(part, fill_value = 0).astype('int64')
+
+
+class RegistrationAggregator:
+    '''Counters and running sums for the EV.py reports, filled chunk by chunk.'''
+
+    def __init__(self):
+        self.rows = 0
+        self.counts = dict.fromkeys(COUNT_KEYS)
+        self.range_sums = dict.fromkeys(RANGE_SUM_KEYS)
+        self.range_counts = dict.fromkeys(RANGE_SUM_KEYS)
+        self.null_counts = None
+        # per-mile counts and moments of Electric Range for the histogram
+        self.range_summary = RangeSummary()
+        # monthly / weekly registrations and revenue by Sale Date, for chunks that have the column
+        self.sales = SalesSeries()
+
+    def update(self, chunk):
+        '''Fold one chunk into every accumulator.
+
+        There is no global dropna: each counter only skips the rows missing one of its own columns (groupby
+        leaves out missing keys, sum / count leave out missing ranges), and the null counts of the data quality
+        report are collected from the same chunk.'''
+        self.rows += len(chunk)
+        self.null_counts = _add(self.null_counts, chunk.isna().sum().rename('nulls'))
+        for name, keys in COUNT_KEYS.items():
+            part = _plain_index(chunk.groupby(keys, observed = True).size())
+            self.counts[name] = _add(self.counts[name], part)
+        ranges = chunk[RANGE].astype('float64')
+        for name, keys in RANGE_SUM_KEYS.items():
+            part = ranges.groupby([chunk[key] for key in keys], observed = True).agg(['sum', 'count'])
+            part = _plain_index(part)
+            self.range_sums[name] = _add(self.range_sums[name], part['sum'].astype('int64'))
+            self.range_counts[name] = _add(self.range_counts[name], part['count'])
+        self.range_summary.update(ranges.dropna().to_numpy())
+        if SALE_DATE in chunk.columns:
+            self.sales.update(chunk)
+        return self
+
+    def merge(self, other):
+        '''Fold the partial tables of another aggregator into this one. Counts and sums add, so the merged
+        result is exactly what a single pass over both inputs would give.'''
+        self.rows += other.rows
+        for name in self.counts:
+            if other.counts[name] is not None:
+                self.counts[name] = _add(self.counts[name], other.counts[name])
+        for name in self.range_sums:
+            if other.range_sums[name] is not None:
+                self.range_sums[name] = _add(self.range_sums[name], other.range_sums[name])
+                self.range_counts[name] = _add(self.range_counts[name], other.range_counts[name])
+        if other.null_counts is not None:
+            self.null_counts = _add(self.null_counts, other.null_counts)
+        self.range_summary.merge(other.range_summary)
+        self.sales.merge(other.sales)
+        return self
+
+    def count(self, name):
+        return self.counts[name] if self.counts[name] is not None else pd.Series(dtype = 'int64')
+
+    def mean_range(self, name):
+        '''Average Electric Range per group of RANGE_SUM_KEYS[name], over the rows that have a range.'''
+        if self.range_sums[name] is None:
+            return pd.Series(dtype = 'float64')
+        counts = self.range_counts[name]
+        return (self.range_sums[name] / counts)[counts > 0]
+
+    def reports(self, top = 10, top_makes = 5):
+        '''The tables computed by the EV.py cells, keyed by the notebook variable names.'''
+        year_counts = self.count('year').rename_axis(YEAR).rename('count')
+        EV_adoption_by_year = year_counts.sort_values(ascending = False)
+        County = self.count('county').rename_axis('County').rename('count').sort_values(ascending = False)
+        # top k by partial selection rather than a sort of every (County, City) group
+        county_city = self.count('county_city').rename_axis(['County', 'City'])
+        Distribution = county_city.iloc[top_k(county_city.to_numpy(), top)].reset_index(name = 'Count')
+        Vehicle_type = (self.count('vehicle_type').rename_axis(VEHICLE_TYPE).rename('count')
+                        .sort_values(ascending = False))
+        make_counts = self.count('make').rename_axis('Make').rename('count').sort_values(ascending = False)
+        Top_manufacturers = make_counts.head(top)
+        # from every make, top_makes may be larger than top
+        Top_5_manufacturers = make_counts.head(top_makes).index
+
+        make_model = self.count('make_model').rename_axis(['Make', 'Model'])
+        in_top_makes = make_model.index.get_level_values('Make').isin(Top_5_manufacturers)
+        Top_models = make_model[in_top_makes].sort_values(ascending = False).reset_index(name = 'Count').head(top)
+
+        Avg_EV_range = self.mean_range('year').rename_axis(YEAR).sort_index().reset_index(name = 'Avg_range')
+        range_by_model = self.mean_range('make_model').rename_axis(['Make', 'Model'])
+        in_top_makes = range_by_model.index.get_level_values('Make').isin(Top_5_manufacturers)
+        avg_range_by_manufacturers = (range_by_model[in_top_makes].sort_values(ascending = False)
+                                      .reset_index(name = 'Range in miles'))
+        Top_range_models = avg_range_by_manufacturers.head(top)
+
+        EV_registration_counts = year_counts.sort_index()
+        Range_counts = self.range_summary.to_counts()
+        Null_counts = self.null_counts if self.null_counts is not None else pd.Series(dtype = 'int64')
+        return {
+            'EV_adoption_by_year': EV_adoption_by_year,
+            'County': County,
+            'Distribution': Distribution,
+            'Vehicle_type': Vehicle_type,
+            'Top_manufacturers': Top_manufacturers,
+            'Top_5_manufacturers': Top_5_manufacturers,
+            'Top_models': Top_models,
+            'Avg_EV_range': Avg_EV_range,
+            'avg_range_by_manufacturers': avg_range_by_manufacturers,
+            'Top_range_models': Top_range_models,
+            'EV_registration_counts': EV_registration_counts,
+            'Range_counts': Range_counts,
+            'Null_counts': Null_counts,
+            'Monthly_sales': self.sales.monthly(),
+        }
+
+
+def yearly_matrix(counts):
+    '''Turn a (key, Model Year) count table into a series x year matrix, missing years filled with 0.'''
+    return counts.unstack(fill_value = 0).sort_index(axis = 1)
+
+
+def aggregate_chunks(chunks):
+    aggregator = RegistrationAggregator()
+    for chunk in chunks:
+        aggregator.update(chunk)
+    return aggregator
+
+
+def aggregate_csv(path = DATA_FILE, chunksize = DEFAULT_CHUNKSIZE):
+    '''Read `path` once in chunks and return the filled RegistrationAggregator.'''
+    return aggregate_chunks(load_registrations(path, AGGREGATE_COLUMNS, chunksize))
+
+
+if __name__ == '__main__':
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    for name, table in aggregate_csv(path).reports().items():
+        print(f'{name}\n{table}\n')
@@ -0,0 +1,199 @@
+#Command line entry point for running a subset of the EV analyses
+
+'''Running EV.py for one number means importing pandas, matplotlib, seaborn and scipy, loading every analysis
+column and executing every cell. Here each analysis declares the columns it reads and builds only its own tables:
+
+    python -m ev_analysis run --only forecast,top-makes --out report/
+    python -m ev_analysis run --only top-cities --figures
+    python -m ev_analysis list
+
+Only the union of the selected analyses' columns is loaded (through the ev_cache Feather cache, one cache file per
+column set), the tables are written as CSV, and matplotlib / seaborn are imported only with --figures, scipy only
+for the logistic model. Every analysis runs when --only is not given.'''
+
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+from ev_clean import ANALYSIS_READS
+from ev_loader import ANALYSIS_COLUMNS, DATA_FILE, RANGE, SERIES_COLUMNS, VEHICLE_TYPE, YEAR, load_registrations
+
+
+Analysis = namedtuple('Analysis', ['name', 'columns', 'build'])
+
+ANALYSES = {}
+
+
+def register_analysis(name, build, columns = None):
+    '''Register an analysis. `build(frame, options)` returns {table name: table} from a frame holding `columns`,
+    by default the columns ev_clean.ANALYSIS_READS lists for `name`.'''
+    ANALYSES[name] = Analysis(name, ANALYSIS_READS[name] if columns is None else columns, build)
+    return ANALYSES[name]
+
+
+def _adoption(frame, options):
+    return {'EV_adoption_by_year': frame[YEAR].value_counts()}
+
+
+def _counties(frame, options):
+    return {'County': frame['County'].value_counts()}
+
+
+def _top_cities(frame, options):
+    from ev_geo import top_k
+    county_city = frame.groupby(['County', 'City'], observed = True).size()
+    return {'Distribution': county_city.iloc[top_k(county_city.to_numpy(), options.top)].reset_index(name = 'Count')}
+
+
+def _vehicle_types(frame, options):
+    return {'Vehicle_type': frame[VEHICLE_TYPE].value_counts()}
+
+
+def _top_makes(frame, options):
+    return {'Top_manufacturers': frame['Make'].value_counts().head(options.top)}
+
+
+def _top_make_names(frame, options):
+    return frame['Make'].value_counts().head(options.top_makes).index
+
+
+def _top_models(frame, options):
+    make_model = frame.groupby(['Make', 'Model'], observed = True).size()
+    in_top_makes = make_model.index.get_level_values('Make').isin(_top_make_names(frame, options))
+    return {'Top_models': make_model[in_top_makes].sort_values(ascending = False).reset_index(name = 'Count')
+            .head(options.top)}
+
+
+def _range(frame, options):
+    from ev_range import RangeSummary
+    return {'Range_counts': RangeSummary.from_values(frame[RANGE]).to_counts()}
+
+
+def _range_by_year(frame, options):
+    return {'Avg_EV_range': frame.groupby(YEAR)[RANGE].mean().dropna().reset_index(name = 'Avg_range')}
+
+
+def _range_by_model(frame, options):
+    range_by_model = frame.groupby(['Make', 'Model'], observed = True)[RANGE].mean().dropna()
+    in_top_makes = range_by_model.index.get_level_values('Make').isin(_top_make_names(frame, options))
+    avg_range_by_manufacturers = (range_by_model[in_top_makes].sort_values(ascending = False)
+                                  .reset_index(name = 'Range in miles'))
+    return {'avg_range_by_manufacturers': avg_range_by_manufacturers,
+            'Top_range_models': avg_range_by_manufacturers.head(options.top)}
+
+
+def _forecaster(options):
+    from ev_forecast import Forecaster
+    settings = {'cutoff': options.cutoff, 'horizon': options.horizon}
+    return Forecaster(options.model, **{key: value for key, value in settings.items() if value is not None})
+
+
+def _forecast(frame, options):
+    from ev_forecast import forecast_table
+    EV_registration_counts = frame[YEAR].value_counts().sort_index()
+    return {'Forecast': forecast_table(EV_registration_counts, _forecaster(options), resamples = options.resamples)}
+
+
+def _monthly(frame, options):
+    from ev_series import SalesSeries, yearly_forecast
+    sales = SalesSeries.from_frame(frame)
+    forecaster = _forecaster(options)
+    return {'Monthly_sales': sales.monthly(), 'Weekly_sales': sales.weekly(),
+            'Sales_forecast': yearly_forecast(sales, forecaster)}
+
+
+register_analysis('adoption', _adoption)
+register_analysis('counties', _counties)
+register_analysis('top-cities', _top_cities)
+register_analysis('vehicle-types', _vehicle_types)
+register_analysis('top-makes', _top_makes)
+register_analysis('top-models', _top_models)
+register_analysis('range', _range)
+register_analysis('range-by-year', _range_by_year)
+register_analysis('range-by-model', _range_by_model)
+register_analysis('forecast', _forecast)
+register_analysis('monthly', _monthly)
+
+
+def selected_columns(names):
+    '''Union of the columns of the `names` analyses, in file schema order so the cache key is stable.'''
+    needed = {column for name in names for column in ANALYSES[name].columns}
+    return [column for column in ANALYSIS_COLUMNS + SERIES_COLUMNS if column in needed]
+
+
+def run(names, path, out_dir, options):
+    '''Load the columns of the `names` analyses, build their tables and write them to `out_dir`.'''
+    timings = {}
+    start = time.perf_counter()
+    columns = selected_columns(names)
+    if options.no_cache:
+        frame = load_registrations(path, columns)
+    else:
+        from ev_cache import load_cached
+        frame = load_cached(path, columns)
+    timings['load'] = time.perf_counter() - start
+
+    tables = {}
+    for name in names:
+        began = time.perf_counter()
+        tables.update(ANALYSES[name].build(frame, options))
+        timings[name] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    if options.figures:
+        from ev_report import FIGURES, render_report
+        figures = [figure for figure, (_, needed) in FIGURES.items() if all(table in tables for table in needed)]
+        render_report(tables, out_dir, figures = figures, workers = 1)
+    else:
+        os.makedirs(out_dir, exist_ok = True)
+        for name, table in tables.items():
+            table.to_csv(os.path.join(out_dir, f'{name}.csv'))
+    timings['write'] = time.perf_counter() - began
+    return tables, columns, timings
+
+
+def _analysis_list(value):
+    names = [name for name in value.split(',') if name]
+    unknown = [name for name in names if name not in ANALYSES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown analyses {unknown}, expected {sorted(ANALYSES)}')
+    return names
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'ev_analysis', description = 'Run selected EV market size analyses')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    commands.add_parser('list', help = 'list the analyses and the columns they read')
+    run_parser = commands.add_parser('run', help = 'run analyses and write their tables')
+    run_parser.add_argument('--only', type = _analysis_list, default = None,
+                            help = 'comma separated analyses to run (default: all)')
+    run_parser.add_argument('--csv', default = DATA_FILE)
+    run_parser.add_argument('--out', default = 'report')
+    run_parser.add_argument('--figures', action = 'store_true', help = 'also render the figures of the tables')
+    run_parser.add_argument('--no-cache', action = 'store_true', help = 'parse the CSV instead of the Feather cache')
+    run_parser.add_argument('--top', type = int, default = 10)
+    run_parser.add_argument('--top-makes', type = int, default = 5)
+    run_parser.add_argument('--model', default = 'exponential', help = 'forecasting model')
+    run_parser.add_argument('--cutoff', type = int, default = None, help = 'first incomplete Model Year')
+    run_parser.add_argument('--horizon', type = int, default = None, help = 'years to forecast')
+    run_parser.add_argument('--resamples', type = int, default = 10000, help = 'bootstrap resamples for the interval')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name, entry in ANALYSES.items():
+            print(f'{name:<16} {", ".join(entry.columns)}')
+        return 0
+
+    names = args.only or list(ANALYSES)
+    tables, columns, timings = run(names, args.csv, args.out, args)
+    print(f'read {len(columns)} columns: {", ".join(columns)}')
+    for stage, seconds in timings.items():
+        print(f'  {stage:<16} {seconds:8.3f}s')
+    print(f'wrote {len(tables)} tables to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
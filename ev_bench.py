@@ -0,0 +1,148 @@
+#Benchmark suite for the EV analysis pipeline on synthetic data
+
+'''Times and memory-profiles each stage of the analysis (load, lazy and dropna cleaning, every aggregation, the
+curve_fit forecast and the figure rendering) on the synthetic 1M / 10M / 50M row files from ev_synth. Every run is
+saved as JSON under bench_results/ and compared with the previous run of the same size, so a slower stage shows up
+as a ratio above 1.
+
+    python ev_bench.py [--time-only] 1m [10m 50m]
+
+Memory is the tracemalloc peak of the stage (NumPy and pandas buffers are traced), next to the process peak RSS.
+Tracing slows allocation-heavy stages such as the CSV parse several times over, so each stage is timed untraced
+and then run a second time under tracemalloc for its memory peak; --time-only skips the traced runs.'''
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from ev_clean import LazyCleaner
+from ev_loader import load_registrations, peak_rss_mb
+from ev_synth import SIZES, generate, synthetic_path
+
+
+RESULTS_DIR = 'bench_results'
+# set to False (--time-only) to skip the second, traced run of every stage
+TRACE_MEMORY = True
+
+
+def measure(results, name, function, *args):
+    '''Run one stage, record its wall time and traced peak memory, and return its result.'''
+    start = time.perf_counter()
+    value = function(*args)
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if TRACE_MEMORY:
+        tracemalloc.start()
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = round(peak / (1024 * 1024), 2)
+    results[name] = {
+        'seconds': round(seconds, 4),
+        'peak_mb': peak_mb,
+        'rss_mb': round(peak_rss_mb(), 1),
+    }
+    print(f'  {name:<28} {seconds:8.3f}s {peak_mb if peak_mb is not None else "-":>10} MB')
+    return value
+
+
+def _curve_fit_forecast(EV_registration_counts):
+    from scipy.optimize import curve_fit
+    from ev_forecast import exp_growth
+    filtered_years = EV_registration_counts[EV_registration_counts.index < 2024]
+    x_data = filtered_years.index - filtered_years.index.min()
+    params, _ = curve_fit(exp_growth, x_data, filtered_years.values.astype(float))
+    return exp_growth(np.arange(2024, 2024 + 6) - filtered_years.index.min(), *params)
+
+
+def _render(tables):
+    from ev_report import render_report
+    with tempfile.TemporaryDirectory() as out_dir:
+        return render_report(tables, out_dir, formats = ('png',), workers = 1, force = True)
+
+
+def run_stages(path):
+    '''Run every stage on `path` and return {stage: metrics}.'''
+    results = {}
+    EVdata = measure(results, 'load', load_registrations, path)
+    measure(results, 'lazy_clean', lambda: LazyCleaner(EVdata).analysis_report())
+    EVdata = measure(results, 'dropna', lambda: EVdata.dropna())
+    measure(results, 'adoption_by_year', lambda: EVdata['Model Year'].value_counts())
+    measure(results, 'county_counts', lambda: EVdata['County'].value_counts())
+    measure(results, 'county_city_top10', lambda: EVdata.groupby(['County', 'City'], observed = True).size()
+            .sort_values(ascending = False).head(10))
+    measure(results, 'vehicle_type_counts', lambda: EVdata['Clean Alternative Fuel Vehicle Type'].value_counts())
+    Top_manufacturers = measure(results, 'make_counts', lambda: EVdata['Make'].value_counts().head(10))
+
+    def top_models():
+        top_5 = EVdata[EVdata['Make'].isin(Top_manufacturers.head(5).index)]
+        return top_5.groupby(['Make', 'Model'], observed = True).size().sort_values(ascending = False).head(10)
+
+    measure(results, 'top_models', top_models)
+    measure(results, 'avg_range_by_year', lambda: EVdata.groupby('Model Year')['Electric Range'].mean())
+    EV_registration_counts = measure(results, 'registration_counts',
+                                     lambda: EVdata['Model Year'].value_counts().sort_index())
+    measure(results, 'curve_fit_forecast', _curve_fit_forecast, EV_registration_counts)
+    EVdata = None
+
+    from ev_aggregate import aggregate_csv
+    from ev_report import build_tables
+    aggregator = measure(results, 'streaming_aggregate', aggregate_csv, path)
+    tables = measure(results, 'report_tables', build_tables, aggregator)
+    measure(results, 'render_figures', _render, tables)
+    return results
+
+
+def _previous(size):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    runs = sorted(name for name in os.listdir(RESULTS_DIR) if name.startswith(f'{size}-') and name.endswith('.json'))
+    if not runs:
+        return None
+    with open(os.path.join(RESULTS_DIR, runs[-1])) as handle:
+        return json.load(handle)
+
+
+def compare(current, previous):
+    '''Print the time ratio of every stage against the previous run.'''
+    print(f'  compared with the run of {previous["timestamp"]}:')
+    for name, metrics in current['stages'].items():
+        before = previous['stages'].get(name)
+        if before and before['seconds'] > 0:
+            print(f'  {name:<28} x{metrics["seconds"] / before["seconds"]:.2f}')
+
+
+def benchmark(size):
+    path = synthetic_path(size)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        print(f'generating {SIZES[size]} rows into {path}')
+        generate(path, SIZES[size])
+    print(f'{size} ({SIZES[size]} rows)')
+    previous = _previous(size)
+    run = {
+        'size': size,
+        'rows': SIZES[size],
+        'timestamp': datetime.now().isoformat(timespec = 'seconds'),
+        'stages': run_stages(path),
+    }
+    os.makedirs(RESULTS_DIR, exist_ok = True)
+    with open(os.path.join(RESULTS_DIR, f'{size}-{run["timestamp"].replace(":", "")}.json'), 'w') as handle:
+        json.dump(run, handle, indent = 2)
+    if previous:
+        compare(run, previous)
+    return run
+
+
+if __name__ == '__main__':
+    sizes = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if '--time-only' in sys.argv[1:]:
+        TRACE_MEMORY = False
+    for size in sizes or ['1m']:
+        benchmark(size)
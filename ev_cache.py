@@ -0,0 +1,94 @@
+#On-disk columnar cache of the typed registration table
+
+'''Every run of EV.py used to re-parse the whole CSV. The typed frame of the loaded columns is now written once as
+an uncompressed Feather (Arrow IPC) file, with the categorical columns stored dictionary-encoded, and later runs
+memory-map it instead of parsing the CSV. There is one cache file per source file (by absolute path) and column
+set.
+
+The cache is keyed by the source file's size, mtime and content hash. Size and mtime are checked first; the
+content is only re-hashed when they change, so an untouched CSV costs a stat() call and a touched but identical
+one does not force a rebuild.
+
+No dropna is cached: the analyses skip only the rows missing their own columns (see ev_clean).'''
+
+import hashlib
+import json
+import os
+
+import pyarrow.feather as feather
+
+from ev_loader import ANALYSIS_COLUMNS, DATA_FILE, load_registrations
+
+
+CACHE_DIR = '.ev_cache'
+HASH_BLOCK = 1 << 20
+
+
+def file_hash(path):
+    '''blake2b digest of the file contents, read in 1 MB blocks.'''
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path, columns, cache_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    # files with the same name in different directories get their own cache
+    path_key = hashlib.blake2b(os.path.abspath(path).encode(), digest_size = 4).hexdigest()
+    column_key = hashlib.blake2b('|'.join(columns).encode(), digest_size = 4).hexdigest()
+    stem = os.path.join(cache_dir, f'{name}-{path_key}-{column_key}')
+    return stem + '.feather', stem + '.json'
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def source_key(path, meta = None):
+    '''Cache key for `path`. Reuses the stored hash from `meta` when size and mtime are unchanged.'''
+    stat = os.stat(path)
+    key = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if meta and meta.get('size') == key['size'] and meta.get('mtime_ns') == key['mtime_ns']:
+        key['hash'] = meta['hash']
+    else:
+        key['hash'] = file_hash(path)
+    return key
+
+
+def build_cache(path = DATA_FILE, columns = None, cache_dir = CACHE_DIR):
+    '''Parse the CSV, then write the Feather cache and its metadata. Returns the cached frame.'''
+    columns = list(columns or ANALYSIS_COLUMNS)
+    data_path, meta_path = _cache_paths(path, columns, cache_dir)
+    os.makedirs(cache_dir, exist_ok = True)
+    key = source_key(path)
+    frame = load_registrations(path, columns)
+    # write to a temporary name first so an interrupted run never leaves a half written cache behind
+    feather.write_feather(frame, data_path + '.tmp', compression = 'uncompressed')
+    os.replace(data_path + '.tmp', data_path)
+    with open(meta_path, 'w') as handle:
+        json.dump(dict(key, columns = columns, rows = len(frame)), handle)
+    return frame
+
+
+def load_cached(path = DATA_FILE, columns = None, cache_dir = CACHE_DIR, rebuild = False):
+    '''Return the typed registration frame of `columns`, from the cache when it is still valid for `path`.'''
+    columns = list(columns or ANALYSIS_COLUMNS)
+    data_path, meta_path = _cache_paths(path, columns, cache_dir)
+    meta = _read_meta(meta_path)
+    if rebuild or meta is None or not os.path.exists(data_path):
+        return build_cache(path, columns, cache_dir)
+    key = source_key(path, meta)
+    if key['hash'] != meta['hash']:
+        return build_cache(path, columns, cache_dir)
+    if key['mtime_ns'] != meta['mtime_ns']:
+        # same contents with a new timestamp, remember it so the next run skips the hash
+        meta.update(key)
+        with open(meta_path, 'w') as handle:
+            json.dump(meta, handle)
+    return feather.read_table(data_path, memory_map = True).to_pandas()
@@ -0,0 +1,102 @@
+#Column-aware data quality report instead of a global dropna
+
+'''EVdata.dropna(inplace=True) copies the whole table and throws away every row with a missing value in any
+column, including rows that are perfectly valid for analyses that never read that column, and the two
+isnull().sum() calls around it scan the whole frame twice more.
+
+No analysis needs that copy: value_counts, groupby and mean leave out missing keys and values, and
+RegistrationStore codes them as -1, so each analysis already skips only the rows missing one of its own columns.
+LazyCleaner computes the null mask of a column once, the first time it is needed, and keeps it packed as a bitmap
+(one bit per row). Every analysis declares the columns it reads (ANALYSIS_READS below, which ev_analysis registers
+its analyses from); the rows it loses are counted from the OR of its columns' bitmaps, byte by byte, and its valid
+rows are that OR inverted, unpacked only when a boolean mask or row ids are asked for.'''
+
+import numpy as np
+import pandas as pd
+
+from ev_loader import RANGE, SALE_DATE, SALE_PRICE, VEHICLE_TYPE, YEAR
+
+
+# analysis -> the columns it reads, a row is dropped for an analysis only if one of these is missing
+ANALYSIS_READS = {
+    'adoption': [YEAR],
+    'counties': ['County'],
+    'top-cities': ['County', 'City'],
+    'vehicle-types': [VEHICLE_TYPE],
+    'top-makes': ['Make'],
+    'top-models': ['Make', 'Model'],
+    'range': [RANGE],
+    'range-by-year': [YEAR, RANGE],
+    'range-by-model': ['Make', 'Model', RANGE],
+    'forecast': [YEAR],
+    'monthly': [SALE_DATE, SALE_PRICE],
+}
+
+# number of set bits of every byte value
+_BIT_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype = np.int64)
+
+
+class LazyCleaner:
+    '''Per-column null bitmaps of `frame`, computed on demand and combined per analysis.'''
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.size = len(frame)
+        self._bitmaps = {}
+        self._null_counts = {}
+
+    def null_bitmap(self, column):
+        '''Packed null bitmap of `column` (np.packbits of its isna mask).'''
+        if column not in self._bitmaps:
+            nulls = self.frame[column].isna().to_numpy()
+            self._bitmaps[column] = np.packbits(nulls)
+            self._null_counts[column] = int(np.count_nonzero(nulls))
+        return self._bitmaps[column]
+
+    def columns_for(self, analysis_or_columns):
+        if isinstance(analysis_or_columns, str):
+            return ANALYSIS_READS[analysis_or_columns]
+        return list(analysis_or_columns)
+
+    def _null_rows(self, analysis_or_columns):
+        '''Packed bitmap of the rows missing a column of an analysis (or a column list), None if there are none.'''
+        columns = self.columns_for(analysis_or_columns)
+        bitmaps = [self.null_bitmap(column) for column in columns]
+        if not any(self._null_counts[column] for column in columns):
+            return None
+        return np.bitwise_or.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0]
+
+    def valid_mask(self, analysis_or_columns):
+        '''Boolean mask of the rows with no missing value in the columns of an analysis (or a column list).'''
+        nulls = self._null_rows(analysis_or_columns)
+        if nulls is None:
+            return np.ones(self.size, dtype = bool)
+        return ~np.unpackbits(nulls, count = self.size).astype(bool)
+
+    def valid_rows(self, analysis_or_columns):
+        '''Row positions valid for an analysis, for index based consumers such as RegistrationStore.'''
+        return np.flatnonzero(self.valid_mask(analysis_or_columns))
+
+    def dropped(self, analysis_or_columns):
+        '''Number of rows an analysis has to skip, counted on the packed bitmap.'''
+        nulls = self._null_rows(analysis_or_columns)
+        # packbits pads the last byte with zero bits, so they are never counted
+        return 0 if nulls is None else int(_BIT_COUNTS[nulls].sum())
+
+    def quality_report(self, columns = None):
+        '''Null count and share per column, the isnull().sum() of EV.py, from the same bitmaps.'''
+        columns = list(columns or self.frame.columns)
+        for column in columns:
+            self.null_bitmap(column)
+        nulls = pd.Series([self._null_counts[column] for column in columns], index = columns, name = 'nulls')
+        return pd.DataFrame({'nulls': nulls, 'null_share': nulls / max(self.size, 1)})
+
+    def analysis_report(self):
+        '''Rows kept and dropped by every registered analysis whose columns are in the frame, next to a dropna over
+        all of the frame's columns. That last row only covers the loaded columns, not every column of the file.'''
+        loaded = set(self.frame.columns)
+        dropped = {name: self.dropped(name) for name, columns in ANALYSIS_READS.items() if set(columns) <= loaded}
+        dropped['any loaded column'] = self.dropped(list(self.frame.columns))
+        report = pd.DataFrame({'rows_dropped': dropped})
+        report.insert(0, 'rows_kept', self.size - report['rows_dropped'])
+        return report
@@ -0,0 +1,396 @@
+#Vectorized exponential growth forecasts for many series at once
+
+'''EV.py fits a single exp_growth curve, a * exp(b * x), with scipy's curve_fit on the national Model Year counts.
+Forecasting every County, Make and vehicle type means thousands of such fits, so here all series are stacked into
+one (series x year) matrix and fitted together with NumPy:
+
+1. a closed form log-linear least squares fit, log(y) = log(a) + b * x, weighted by y so it approximates the
+   absolute-error fit curve_fit does (years with 0 registrations get weight 0),
+2. optionally a few batched Levenberg-Marquardt steps on the original nonlinear least squares problem.
+
+Standard errors come from the same covariance estimate curve_fit returns, inv(J'J) * SSE / (n - 2), and the
+projection uncertainty from the delta method.'''
+
+import hashlib
+import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ev_aggregate import yearly_matrix
+
+
+CUTOFF_YEAR = 2024
+HORIZON = np.arange(2024, 2024 + 6)
+
+
+def exp_growth(x, a, b):
+    return a * np.exp(b * x)
+
+
+def loglinear_fit(x, Y):
+    '''Closed form weighted log-linear fit of every row of Y against x. Returns (a, b); NaN where a row has fewer
+    than two positive points.'''
+    W = np.where(Y > 0, Y, 0.0)
+    logY = np.log(np.where(Y > 0, Y, 1.0))
+    S0 = W.sum(axis = 1)
+    S1 = W @ x
+    S2 = W @ (x * x)
+    T0 = (W * logY).sum(axis = 1)
+    T1 = (W * logY) @ x
+    det = S0 * S2 - S1 * S1
+    enough = ((Y > 0).sum(axis = 1) >= 2) & (det > 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        b = np.where(enough, (S0 * T1 - S1 * T0) / det, np.nan)
+        log_a = np.where(enough, (S2 * T0 - S1 * T1) / det, np.nan)
+    return np.exp(log_a), b
+
+
+def _jacobian_terms(x, Y, a, b, log_scale = False, mask = None):
+    # with log_scale the first parameter is log(a), which keeps the two Jacobian columns on a similar scale;
+    # points where the 0 / 1 mask is 0 drop out of the residuals and the Jacobian
+    E = np.exp(np.outer(b, x))
+    F = a[:, None] * E
+    R = Y - F
+    Ja = F if log_scale else E
+    Jb = F * x
+    if mask is not None:
+        R, Ja, Jb = R * mask, Ja * mask, Jb * mask
+    JtJ = np.stack([(Ja * Ja).sum(axis = 1), (Ja * Jb).sum(axis = 1), (Jb * Jb).sum(axis = 1)])
+    Jtr = np.stack([(Ja * R).sum(axis = 1), (Jb * R).sum(axis = 1)])
+    return JtJ, Jtr, (R * R).sum(axis = 1)
+
+
+def refine_fit(x, Y, a, b, iterations = 100, tol = 1e-12, mask = None):
+    '''Batched Levenberg-Marquardt on sum((Y - a * exp(b * x))**2), starting from (a, b), over the points where
+    `mask` (series x year, 0 or 1) is 1, or all of them.'''
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        log_a = np.log(a)
+    b = b.copy()
+    damping = np.full(len(a), 1e-3)
+    active = np.isfinite(log_a) & np.isfinite(b)
+    log_a = np.where(active, log_a, np.nan)
+    with np.errstate(over = 'ignore', invalid = 'ignore'):
+        JtJ, Jtr, sse = _jacobian_terms(x, Y, np.exp(np.nan_to_num(log_a)), np.nan_to_num(b), log_scale = True,
+                                        mask = mask)
+    for _ in range(iterations):
+        if not active.any():
+            break
+        # solve the damped 2 x 2 normal equations for every series at once
+        h11 = JtJ[0] * (1 + damping)
+        h22 = JtJ[2] * (1 + damping)
+        det = h11 * h22 - JtJ[1] ** 2
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            dlog_a = (h22 * Jtr[0] - JtJ[1] * Jtr[1]) / det
+            db = (h11 * Jtr[1] - JtJ[1] * Jtr[0]) / det
+        step = active & np.isfinite(dlog_a) & np.isfinite(db)
+        new_log_a = np.where(step, log_a + dlog_a, log_a)
+        new_b = np.where(step, b + db, b)
+        with np.errstate(over = 'ignore', invalid = 'ignore'):
+            new_JtJ, new_Jtr, new_sse = _jacobian_terms(x, Y, np.exp(np.nan_to_num(new_log_a)), np.nan_to_num(new_b),
+                                                        log_scale = True, mask = mask)
+        better = step & np.isfinite(new_sse) & (new_sse <= sse)
+        converged = better & (sse - new_sse <= tol * np.maximum(sse, 1.0))
+        log_a = np.where(better, new_log_a, log_a)
+        b = np.where(better, new_b, b)
+        JtJ = np.where(better, new_JtJ, JtJ)
+        Jtr = np.where(better, new_Jtr, Jtr)
+        sse = np.where(better, new_sse, sse)
+        damping = np.where(better, damping / 10, damping * 10)
+        active &= ~converged & (damping < 1e12)
+    return np.exp(log_a), b
+
+
+def fit_covariance(x, Y, a, b, mask = None):
+    '''Parameter covariance per series, as curve_fit computes it: inv(J'J) * SSE / (n - 2), with n the number of
+    points `mask` keeps.'''
+    JtJ, _, sse = _jacobian_terms(x, Y, np.nan_to_num(a), np.nan_to_num(b), mask = mask)
+    dof = (Y.shape[1] if mask is None else mask.sum(axis = 1)) - 2
+    det = JtJ[0] * JtJ[2] - JtJ[1] ** 2
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        scale = np.where(dof > 0, sse / dof / det, np.inf)
+    cov = np.empty((len(a), 2, 2))
+    cov[:, 0, 0] = JtJ[2] * scale
+    cov[:, 1, 1] = JtJ[0] * scale
+    cov[:, 0, 1] = cov[:, 1, 0] = -JtJ[1] * scale
+    cov[~(np.isfinite(a) & np.isfinite(b))] = np.nan
+    return cov
+
+
+def batch_forecast(matrix, cutoff = CUTOFF_YEAR, horizon = HORIZON, refine = True):
+    '''Fit exp_growth to every row of a (series x year) count matrix and project it over `horizon`.
+
+    Only years before `cutoff` are fitted, as in EV.py, and each series only from its first year with registrations
+    (the `origin` column), the years Forecaster fits for the same series. a is reported for x measured from that
+    origin, so a and b are on the scale of the notebook's params. Returns (params, projections): params has one row
+    per series (a, b, a_se, b_se, ab_cov, origin, points), projections is the tidy (series, year, forecast,
+    forecast_se) table.'''
+    matrix = matrix.loc[:, matrix.columns < cutoff]
+    years = matrix.columns.to_numpy(dtype = float)
+    x = years - years.min()
+    Y = matrix.to_numpy(dtype = float)
+    positive = Y > 0
+    origin = np.where(positive.any(axis = 1), years[positive.argmax(axis = 1)], years.min())
+    # the years before a series' origin are left out of its fit
+    mask = (years[None, :] >= origin[:, None]).astype(float)
+    a, b = loglinear_fit(x, Y)
+    if refine:
+        a, b = refine_fit(x, Y, a, b, mask = mask)
+    cov = fit_covariance(x, Y, a, b, mask = mask)
+
+    # the same curve with x counted from each series' own first year: a_i = a * exp(b * shift), and the covariance
+    # carried through the Jacobian [[exp(b * shift), a * shift * exp(b * shift)], [0, 1]]
+    shift = origin - years.min()
+    with np.errstate(over = 'ignore', invalid = 'ignore'):
+        scale = np.exp(b * shift)
+        a_origin = a * scale
+        da_db = a * shift * scale
+        cov_origin = np.empty_like(cov)
+        cov_origin[:, 0, 0] = (scale * scale * cov[:, 0, 0] + 2 * scale * da_db * cov[:, 0, 1]
+                               + da_db * da_db * cov[:, 1, 1])
+        cov_origin[:, 0, 1] = cov_origin[:, 1, 0] = scale * cov[:, 0, 1] + da_db * cov[:, 1, 1]
+        cov_origin[:, 1, 1] = cov[:, 1, 1]
+
+    params = pd.DataFrame({
+        'a': a_origin,
+        'b': b,
+        'a_se': np.sqrt(cov_origin[:, 0, 0]),
+        'b_se': np.sqrt(cov_origin[:, 1, 1]),
+        'ab_cov': cov_origin[:, 0, 1],
+        'origin': origin.astype(np.int64),
+        'points': positive.sum(axis = 1),
+    }, index = matrix.index)
+
+    horizon = np.asarray(horizon)
+    hx = horizon - years.min()
+    E = np.exp(np.outer(b, hx))
+    forecast = a[:, None] * E
+    # delta method with gradient (exp(b x), a x exp(b x))
+    ga = E
+    gb = forecast * hx
+    variance = (ga * ga * cov[:, 0, 0, None] + 2 * ga * gb * cov[:, 0, 1, None] + gb * gb * cov[:, 1, 1, None])
+    projections = pd.DataFrame({
+        'series': np.repeat(matrix.index.to_numpy(), len(horizon)),
+        'year': np.tile(horizon, len(matrix)),
+        'forecast': forecast.ravel(),
+        'forecast_se': np.sqrt(variance).ravel(),
+    })
+    return params, projections
+
+
+def forecast_groups(aggregator, cutoff = CUTOFF_YEAR, horizon = HORIZON, refine = True):
+    '''Batch forecasts per County, Make and vehicle type from a filled RegistrationAggregator.
+
+    Returns (params, projections) with a leading `group` column naming the breakdown.'''
+    all_params = []
+    all_projections = []
+    for group, name in [('County', 'county_year'), ('Make', 'make_year'),
+                        ('Clean Alternative Fuel Vehicle Type', 'vehicle_type_year')]:
+        params, projections = batch_forecast(yearly_matrix(aggregator.count(name)), cutoff, horizon, refine)
+        all_params.append(params.rename_axis('series').reset_index().assign(group = group))
+        all_projections.append(projections.assign(group = group))
+    return (_group_first(pd.concat(all_params, ignore_index = True)),
+            _group_first(pd.concat(all_projections, ignore_index = True)))
+
+
+def _group_first(frame):
+    return frame[['group'] + [column for column in frame.columns if column != 'group']]
+
+
+#Single series forecasting API with pluggable models
+
+# Forecaster replaces the hard-wired exp_growth / `< 2024` / np.arange(2024, 2024+6) of EV.py with a model name,
+# a cutoff and a horizon. Fits are memoized on the hash of the training series plus the model configuration; the
+# horizon is not part of that key, so what-if runs that only change the horizon (or the plot) reuse the fit.
+
+ForecastModel = namedtuple('ForecastModel', ['name', 'function', 'fit'])
+FitResult = namedtuple('FitResult', ['model', 'params', 'covariance', 'origin'])
+
+MODELS = {}
+FIT_CACHE_SIZE = 256
+_fit_cache = OrderedDict()
+
+
+def register_model(name, function, fit):
+    '''Register a forecasting model. `fit(x, y, **options)` returns (params, covariance) for
+    `function(x, *params)`, where x counts years from the first training year.'''
+    MODELS[name] = ForecastModel(name, function, fit)
+    return MODELS[name]
+
+
+def _fit_exponential(x, y):
+    a, b = loglinear_fit(x, y[None, :])
+    a, b = refine_fit(x, y[None, :], a, b)
+    return np.array([a[0], b[0]]), fit_covariance(x, y[None, :], a, b)[0]
+
+
+def logistic_growth(x, K, r, x0):
+    return K / (1 + np.exp(-r * (x - x0)))
+
+
+def _fit_logistic(x, y):
+    from scipy.optimize import curve_fit
+    # start from a saturation level of twice the latest count, reached around the last training year
+    p0 = [2 * y.max(), 0.5, x[-1]]
+    params, covariance = curve_fit(logistic_growth, x, y, p0 = p0, maxfev = 10000)
+    return params, covariance
+
+
+def cagr_growth(x, a, g):
+    return a * (1 + g) ** x
+
+
+def _fit_cagr(x, y, lookback = 5):
+    # Compound Annual Growth Rate between the last training year and `lookback` years earlier
+    start = max(len(y) - 1 - lookback, 0)
+    while start < len(y) - 1 and y[start] <= 0:
+        start += 1
+    periods = len(y) - 1 - start
+    if periods < 1:
+        raise ValueError('CAGR needs two years with registrations')
+    g = (y[-1] / y[start]) ** (1 / periods) - 1
+    a = y[-1] / (1 + g) ** x[-1]
+    return np.array([a, g]), np.full((2, 2), np.nan)
+
+
+register_model('exponential', exp_growth, _fit_exponential)
+register_model('logistic', logistic_growth, _fit_logistic)
+register_model('cagr', cagr_growth, _fit_cagr)
+
+
+def series_hash(series):
+    '''Content hash of a count series, index included.'''
+    hashed = pd.util.hash_pandas_object(series, index = True).to_numpy()
+    return hashlib.blake2b(hashed.tobytes(), digest_size = 16).hexdigest()
+
+
+def clear_fit_cache():
+    _fit_cache.clear()
+
+
+class Forecaster:
+    '''Fit a registered model to the years before `cutoff` and project `horizon` years from the cutoff.
+
+    `options` are passed to the model's fit function (for example lookback for cagr).'''
+
+    def __init__(self, model = 'exponential', cutoff = CUTOFF_YEAR, horizon = len(HORIZON), **options):
+        if model not in MODELS:
+            raise ValueError(f'unknown forecasting model {model!r}, expected one of {sorted(MODELS)}')
+        self.model = MODELS[model]
+        self.cutoff = cutoff
+        self.horizon = horizon
+        self.options = options
+
+    @property
+    def horizon_years(self):
+        return np.arange(self.cutoff, self.cutoff + self.horizon)
+
+    def training_data(self, series):
+        '''The complete years the model is fitted on, the notebook's filtered_years.'''
+        return series[series.index < self.cutoff]
+
+    def _key(self, training):
+        options = tuple(sorted(self.options.items()))
+        return (series_hash(training), self.model.name, self.cutoff, options)
+
+    def fit(self, series):
+        '''Fit the model to `series` (counts indexed by year), reusing an earlier fit of the same data.'''
+        training = self.training_data(series)
+        key = self._key(training)
+        if key in _fit_cache:
+            _fit_cache.move_to_end(key)
+            return _fit_cache[key]
+        origin = training.index.min()
+        x = (training.index - origin).to_numpy(dtype = float)
+        params, covariance = self.model.fit(x, training.to_numpy(dtype = float), **self.options)
+        result = FitResult(self.model.name, params, covariance, origin)
+        _fit_cache[key] = result
+        if len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last = False)
+        return result
+
+    def predict(self, result, years):
+        '''Evaluate a fitted model at `years`.'''
+        x = np.asarray(years) - result.origin
+        return MODELS[result.model].function(x, *result.params)
+
+    def forecast(self, series, horizon = None):
+        '''Forecast indexed by year for the horizon years (or `horizon` years from the cutoff).'''
+        years = self.horizon_years if horizon is None else np.arange(self.cutoff, self.cutoff + horizon)
+        result = self.fit(series)
+        return pd.Series(self.predict(result, years), index = years, name = 'forecast')
+
+
+#Bootstrap prediction intervals
+
+# The exponential fit is resampled by residual bootstrap: new series are built as fitted + resampled residuals,
+# refitted with the batch fitter above, and each refit projection gets one more resampled residual so the band
+# covers both parameter and observation noise. Resamples are generated and fitted as (block x year) arrays, and
+# blocks are spread over a process pool.
+
+BOOTSTRAP_BLOCK = 2000
+# fixed seed of the report tables, so the same counts give the same interval and the report manifest hash is stable
+REPORT_SEED = 0
+
+
+def _bootstrap_block(x, fitted, residuals, hx, size, seed):
+    rng = np.random.default_rng(seed)
+    Y = fitted + rng.choice(residuals, size = (size, len(residuals)))
+    a, b = loglinear_fit(x, Y)
+    a, b = refine_fit(x, Y, a, b)
+    forecast = a[:, None] * np.exp(np.outer(b, hx))
+    return forecast + rng.choice(residuals, size = forecast.shape)
+
+
+def bootstrap_forecast(forecaster, series, resamples = 10000, level = 0.95, workers = None, seed = None):
+    '''Forecast with a residual bootstrap prediction interval. Returns a frame indexed by the horizon years with
+    forecast, lower and upper columns. Only the exponential model has a batch fitter, so only it is supported.'''
+    if forecaster.model.name != 'exponential':
+        raise ValueError('bootstrap intervals are only available for the exponential model')
+    result = forecaster.fit(series)
+    training = forecaster.training_data(series)
+    x = (training.index - result.origin).to_numpy(dtype = float)
+    y = training.to_numpy(dtype = float)
+    fitted = exp_growth(x, *result.params)
+    residuals = y - fitted
+    years = forecaster.horizon_years
+    hx = (years - result.origin).astype(float)
+
+    sizes = [min(BOOTSTRAP_BLOCK, resamples - start) for start in range(0, resamples, BOOTSTRAP_BLOCK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            futures = [pool.submit(_bootstrap_block, x, fitted, residuals, hx, size, block_seed)
+                       for size, block_seed in zip(sizes, seeds)]
+            blocks = [future.result() for future in futures]
+    else:
+        blocks = [_bootstrap_block(x, fitted, residuals, hx, size, block_seed)
+                  for size, block_seed in zip(sizes, seeds)]
+    samples = np.concatenate(blocks)
+    samples = samples[np.isfinite(samples).all(axis = 1)]
+    if not len(samples):
+        raise ValueError(f'none of the {resamples} bootstrap refits converged, the interval cannot be computed')
+    tail = (1 - level) / 2 * 100
+    lower, upper = np.percentile(samples, [tail, 100 - tail], axis = 0)
+    return pd.DataFrame({
+        'forecast': forecaster.predict(result, years),
+        'lower': lower,
+        'upper': upper,
+    }, index = pd.Index(years, name = 'year'))
+
+
+def forecast_table(EV_registration_counts, forecaster = None, resamples = 10000, seed = REPORT_SEED):
+    '''Actual counts of the complete years next to the forecast and, for the exponential model, its bootstrap
+    prediction interval; the table behind the market size plot. The resamples are drawn from `seed`, so the table is
+    reproducible.'''
+    forecaster = forecaster or Forecaster()
+    actual = forecaster.training_data(EV_registration_counts).rename('actual')
+    if forecaster.model.name == 'exponential':
+        predicted = bootstrap_forecast(forecaster, EV_registration_counts, resamples = resamples, workers = 1,
+                                       seed = seed)
+    else:
+        predicted = forecaster.forecast(EV_registration_counts).to_frame().assign(lower = np.nan, upper = np.nan)
+    return pd.concat([actual, predicted], axis = 1).rename_axis('year')
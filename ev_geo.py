@@ -0,0 +1,217 @@
+#Geographic rollup cube: County -> City x vehicle type x Model Year
+
+'''The geography cells of EV.py sort every (County, City) group just to print the first 10, and each new question
+(top cities of one county, county ranks, the same split by vehicle type) is another scan and another full sort.
+
+GeoCube holds registration counts as one dense array of shape (places, vehicle types, years), where a place is a
+(County, City) pair and the places of a county are contiguous, so every county is a slice. The counts come from
+the 'geo' counter of RegistrationAggregator (the same single pass as every other report) or from one groupby of
+a frame. Rows missing the vehicle type or Model Year (or the City) cannot have a cell, so the cube also keeps
+the exact per place and per county totals, from the 'county_city' / 'county' counters (or a County / City and a
+County groupby); unfiltered queries use them, filtered ones count the rows that have all four keys. Any query
+sums the selected vehicle types / year window and picks its top k with np.argpartition, then sorts only those k.
+save() / load() use a compressed .npz, so a dashboard can slice the cube without the rows:
+
+    python ev_geo.py [csv] [--out geo_cube.npz]'''
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ev_loader import DATA_FILE, VEHICLE_TYPE, YEAR
+
+
+GEO_KEYS = ['County', 'City', VEHICLE_TYPE, YEAR]
+
+
+def top_k(values, k):
+    '''Positions of the k largest values, largest first (ties by position): a partial selection, then a sort of
+    only the k selected.'''
+    k = max(0, min(k, len(values)))
+    if k == 0:
+        return np.zeros(0, dtype = np.int64)
+    if k < len(values):
+        chosen = np.argpartition(-values, k - 1)[:k]
+    else:
+        chosen = np.arange(len(values))
+    return chosen[np.lexsort((chosen, -values[chosen]))]
+
+
+class GeoCube:
+    '''Dense registration counts per (County, City) place, vehicle type and Model Year.'''
+
+    def __init__(self, counties, place_county, cities, vehicle_types, years, counts, totals = None,
+                 county_totals = None):
+        self.counties = np.asarray(counties, dtype = str)
+        self.place_county = np.asarray(place_county, dtype = np.int32)
+        self.cities = np.asarray(cities, dtype = str)
+        self.vehicle_types = np.asarray(vehicle_types, dtype = str)
+        self.years = np.asarray(years, dtype = np.int64)
+        self.counts = np.asarray(counts, dtype = np.int64)
+        # places are sorted by county, county i owns places offsets[i]:offsets[i + 1]
+        self.offsets = np.zeros(len(self.counties) + 1, dtype = np.int64)
+        np.cumsum(np.bincount(self.place_county, minlength = len(self.counties)), out = self.offsets[1:])
+        self._county_codes = {county: code for code, county in enumerate(self.counties)}
+        self._type_codes = {vehicle_type: code for code, vehicle_type in enumerate(self.vehicle_types)}
+        # registrations per place and per county, including the rows missing a key of the cube
+        self.totals = self.counts.sum(axis = (1, 2)) if totals is None else np.asarray(totals, dtype = np.int64)
+        if county_totals is None:
+            county_totals = np.bincount(self.place_county, weights = self.totals, minlength = len(self.counties))
+        self.county_totals = np.asarray(county_totals, dtype = np.int64)
+
+    @classmethod
+    def from_counts(cls, counts, place_counts = None, county_counts = None):
+        '''Build the cube from a Series of counts indexed by (County, City, vehicle type, Model Year).
+
+        `place_counts` (indexed by County, City) and `county_counts` (by County) are the exact totals, which also
+        count the rows missing a vehicle type, Model Year or City; they default to sums of the cube.'''
+        counts = counts[counts > 0]
+        index = counts.index
+        if place_counts is None:
+            place_counts = counts.groupby(level = [0, 1]).sum()
+        place_counts = place_counts[place_counts > 0]
+        if county_counts is None:
+            county_counts = place_counts.groupby(level = 0).sum()
+        county_counts = county_counts[county_counts > 0]
+        counties = np.unique(np.concatenate([county_counts.index.astype(str),
+                                             place_counts.index.get_level_values(0).astype(str)]))
+
+        def place_pairs(places):
+            county_codes = np.searchsorted(counties, places.get_level_values(0).astype(str))
+            return pd.MultiIndex.from_arrays([county_codes, places.get_level_values(1).astype(str)])
+
+        # places sorted by county, then city
+        pairs = place_pairs(place_counts.index)
+        order = pairs.argsort()
+        places, totals = pairs[order], place_counts.to_numpy()[order]
+        place_codes = places.get_indexer(place_pairs(index))
+        if (place_codes < 0).any():
+            raise ValueError('place_counts is missing (County, City) places of the cube counts')
+        vehicle_types, type_codes = np.unique(index.get_level_values(2).astype(str), return_inverse = True)
+        years, year_codes = np.unique(index.get_level_values(3).astype(np.int64), return_inverse = True)
+        cube = np.zeros((len(places), len(vehicle_types), len(years)), dtype = np.int64)
+        cube[place_codes, type_codes, year_codes] = counts.to_numpy()
+        county_totals = county_counts.reindex(counties, fill_value = 0).to_numpy()
+        return cls(counties, places.get_level_values(0), places.get_level_values(1), vehicle_types, years, cube,
+                   totals, county_totals)
+
+    @classmethod
+    def from_aggregator(cls, aggregator):
+        return cls.from_counts(aggregator.count('geo'), aggregator.count('county_city'), aggregator.count('county'))
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls.from_counts(frame.groupby(GEO_KEYS, observed = True).size(),
+                               frame.groupby(['County', 'City'], observed = True).size(),
+                               frame['County'].value_counts())
+
+    def save(self, path):
+        np.savez_compressed(path, counties = self.counties, place_county = self.place_county, cities = self.cities,
+                            vehicle_types = self.vehicle_types, years = self.years, counts = self.counts,
+                            totals = self.totals, county_totals = self.county_totals)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle = False) as data:
+            return cls(data['counties'], data['place_county'], data['cities'], data['vehicle_types'],
+                       data['years'], data['counts'], data['totals'], data['county_totals'])
+
+    def _year_slice(self, year_from, year_to):
+        start = 0 if year_from is None else int(np.searchsorted(self.years, year_from, side = 'left'))
+        stop = len(self.years) if year_to is None else int(np.searchsorted(self.years, year_to, side = 'right'))
+        return slice(start, stop)
+
+    def place_counts(self, vehicle_type = None, year_from = None, year_to = None):
+        '''Registrations per place for one vehicle type (None for all) and an inclusive Model Year window. Without
+        a filter these are the exact totals, with one only the rows that have all four keys of the cube.'''
+        if vehicle_type is None and year_from is None and year_to is None:
+            return self.totals
+        cube = self.counts
+        if vehicle_type is not None:
+            if vehicle_type not in self._type_codes:
+                return np.zeros(len(self.cities), dtype = np.int64)
+            code = self._type_codes[vehicle_type]
+            cube = cube[:, code:code + 1]
+        return cube[:, :, self._year_slice(year_from, year_to)].sum(axis = (1, 2))
+
+    def county_counts(self, **filters):
+        '''Registrations per county: the exact County totals without a filter, else summed over its places.'''
+        if not any(value is not None for value in filters.values()):
+            totals = self.county_totals
+        else:
+            totals = np.bincount(self.place_county, weights = self.place_counts(**filters),
+                                 minlength = len(self.counties))
+        return pd.Series(totals.astype(np.int64), index = pd.Index(self.counties, name = 'County'), name = 'count')
+
+    def _places(self, positions, values):
+        return pd.DataFrame({'County': self.counties[self.place_county[positions]], 'City': self.cities[positions],
+                             'Count': values[positions]})
+
+    def _top_places(self, values, k, county):
+        if county is None:
+            chosen = top_k(values, k)
+        elif county not in self._county_codes:
+            return np.zeros(0, dtype = np.int64)
+        else:
+            code = self._county_codes[county]
+            start, stop = self.offsets[code], self.offsets[code + 1]
+            chosen = start + top_k(values[start:stop], k)
+        # places a filter leaves without registrations are not in a groupby of the filtered rows either
+        return chosen[values[chosen] > 0]
+
+    def top_cities(self, k = 10, county = None, **filters):
+        '''Top k (County, City) places, statewide or within one county, as the Distribution table of EV.py.'''
+        values = self.place_counts(**filters)
+        return self._places(self._top_places(values, k, county), values)
+
+    def top_cities_per_county(self, k = 3, **filters):
+        '''Top k cities of every county, with their rank within the county.'''
+        values = self.place_counts(**filters)
+        positions, ranks = [], []
+        for code in range(len(self.counties)):
+            start, stop = self.offsets[code], self.offsets[code + 1]
+            chosen = start + top_k(values[start:stop], k)
+            chosen = chosen[values[chosen] > 0]
+            positions.append(chosen)
+            ranks.append(np.arange(1, len(chosen) + 1))
+        top = self._places(np.concatenate(positions), values)
+        top['Rank'] = np.concatenate(ranks)
+        return top
+
+    def top_counties(self, k = 10, **filters):
+        totals = self.county_counts(**filters)
+        chosen = top_k(totals.to_numpy(), k)
+        return totals.iloc[chosen[totals.to_numpy()[chosen] > 0]]
+
+    def county_ranks(self, **filters):
+        '''Rank of every county within the state, 1 for the most registrations.'''
+        totals = self.county_counts(**filters)
+        order = top_k(totals.to_numpy(), len(totals))
+        ranks = np.empty(len(totals), dtype = np.int64)
+        ranks[order] = np.arange(1, len(totals) + 1)
+        return pd.DataFrame({'count': totals, 'rank': ranks}).iloc[order]
+
+    def vehicle_type_breakdown(self, k = 10, county = None, year_from = None, year_to = None):
+        '''The top k places with their registrations split by vehicle type.'''
+        positions = self._top_places(self.place_counts(None, year_from, year_to), k, county)
+        split = self.counts[positions][:, :, self._year_slice(year_from, year_to)]
+        index = pd.MultiIndex.from_arrays([self.counties[self.place_county[positions]], self.cities[positions]],
+                                          names = ['County', 'City'])
+        return pd.DataFrame(split.sum(axis = 2), index = index, columns = self.vehicle_types)
+
+
+if __name__ == '__main__':
+    from ev_aggregate import aggregate_csv
+
+    parser = argparse.ArgumentParser(description = 'Build the County / City rollup cube and save it as .npz')
+    parser.add_argument('csv', nargs = '?', default = DATA_FILE)
+    parser.add_argument('--out', default = 'geo_cube.npz')
+    args = parser.parse_args()
+
+    cube = GeoCube.from_aggregator(aggregate_csv(args.csv))
+    cube.save(args.out)
+    print(f'{len(cube.cities)} places x {len(cube.vehicle_types)} vehicle types x {len(cube.years)} years '
+          f'-> {args.out}')
+    print(cube.top_cities(10))
@@ -0,0 +1,126 @@
+#Incremental refresh of the aggregate state as the Data.gov file grows
+
+'''The monthly Data.gov export only appends new registration activity, so recomputing everything from scratch
+wastes most of the work. The RegistrationAggregator from the last run is kept on disk together with a watermark:
+the byte offset already ingested, plus a fingerprint of the bytes before it. On the next run only the rows after
+the watermark are parsed and merged, so the refresh costs time in proportion to the new rows.
+
+If the file shrank or the fingerprint changed (a re-sorted or regenerated export), the state no longer describes a
+prefix of the file and it is rebuilt from scratch. The fingerprint hashes sampled blocks of the prefix, which is
+enough to spot a regenerated file; pass verify_full=True to hash the whole prefix when single rows may have been
+edited in place.'''
+
+import hashlib
+import os
+import pickle
+
+from ev_aggregate import DEFAULT_CHUNKSIZE, RegistrationAggregator
+from ev_loader import DATA_FILE
+from ev_parallel import aggregate_range, read_header
+
+
+STATE_FILE = os.path.join('.ev_cache', 'incremental_state.pkl')
+STATE_VERSION = 9
+# the prefix fingerprint hashes this many evenly spaced blocks, always including the first and the last one
+FINGERPRINT_BLOCKS = 64
+FINGERPRINT_BLOCK_SIZE = 4096
+
+
+def _fingerprint(path, offset, full = False):
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as handle:
+        if full or offset <= FINGERPRINT_BLOCKS * FINGERPRINT_BLOCK_SIZE:
+            remaining = offset
+            while remaining > 0:
+                block = handle.read(min(remaining, 1 << 20))
+                digest.update(block)
+                remaining -= len(block)
+        else:
+            last = offset - FINGERPRINT_BLOCK_SIZE
+            for i in range(FINGERPRINT_BLOCKS):
+                handle.seek(last * i // (FINGERPRINT_BLOCKS - 1))
+                digest.update(handle.read(FINGERPRINT_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def _complete_lines_end(path):
+    # only ingest up to the last newline, a half written final row is picked up on the next run
+    size = os.path.getsize(path)
+    with open(path, 'rb') as handle:
+        position = size
+        while position > 0:
+            start = max(position - 4096, 0)
+            handle.seek(start)
+            block = handle.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def load_state(state_file = STATE_FILE):
+    try:
+        with open(state_file, 'rb') as handle:
+            state = pickle.load(handle)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def save_state(state, state_file = STATE_FILE):
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok = True)
+    with open(state_file + '.tmp', 'wb') as handle:
+        pickle.dump(state, handle, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def _state_matches(state, path, names, verify_full):
+    if state is None or state['source'] != os.path.abspath(path) or state['header'] != names:
+        return False
+    if os.path.getsize(path) < state['offset']:
+        return False
+    if verify_full and 'full_fingerprint' in state:
+        return _fingerprint(path, state['offset'], full = True) == state['full_fingerprint']
+    return _fingerprint(path, state['offset']) == state.get('fingerprint')
+
+
+def refresh(path = DATA_FILE, state_file = STATE_FILE, chunksize = DEFAULT_CHUNKSIZE, verify_full = False):
+    '''Bring the stored aggregate state up to date with `path` and return (aggregator, new_rows).'''
+    names, header_end = read_header(path)
+    state = load_state(state_file)
+    if not _state_matches(state, path, names, verify_full):
+        state = {
+            'version': STATE_VERSION,
+            'source': os.path.abspath(path),
+            'header': names,
+            'offset': header_end,
+            'aggregator': RegistrationAggregator(),
+        }
+    end = _complete_lines_end(path)
+    aggregator = state['aggregator']
+    rows_before = aggregator.rows
+    changed = 'fingerprint' not in state
+    if end > state['offset']:
+        aggregator.merge(aggregate_range(path, state['offset'], end, names, chunksize = chunksize))
+        state['offset'] = end
+        changed = True
+    if changed:
+        state['fingerprint'] = _fingerprint(path, state['offset'])
+        state.pop('full_fingerprint', None)
+    if verify_full and 'full_fingerprint' not in state:
+        state['full_fingerprint'] = _fingerprint(path, state['offset'], full = True)
+        changed = True
+    if changed:
+        save_state(state, state_file)
+    return aggregator, aggregator.rows - rows_before
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    start = time.perf_counter()
+    aggregator, new_rows = refresh(path)
+    print(f'ingested {new_rows} new rows ({aggregator.rows} total) in {time.perf_counter() - start:.2f}s')
+    print(aggregator.reports()['EV_registration_counts'])
@@ -0,0 +1,105 @@
+#Multi-core aggregation over byte ranges of the registration CSV
+
+'''The file is cut into byte ranges that start and end on line boundaries. Each worker process parses only its
+range (in chunks) into a RegistrationAggregator and sends the partial count / sum tables back; the parent merges
+them. Because the partials hold full counts rather than per-range top-N lists, the merged top-N tables
+(Distribution.head(10), Top_models.head(10), ...) are exact.
+
+The split assumes no quoted field contains a newline, which holds for the Data.gov export.'''
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from ev_aggregate import AGGREGATE_COLUMNS, DEFAULT_CHUNKSIZE, RegistrationAggregator, aggregate_chunks
+from ev_loader import DATA_FILE, iter_typed_chunks, read_options
+
+
+# more ranges than workers so a slow range does not leave the other cores idle
+RANGES_PER_WORKER = 4
+
+
+class _RangeReader(io.RawIOBase):
+    '''Read-only view of bytes [start, stop) of a file.'''
+
+    def __init__(self, path, start, stop):
+        self._handle = open(path, 'rb')
+        self._handle.seek(start)
+        self._remaining = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._handle.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._handle.close()
+        super().close()
+
+
+def read_header(path):
+    with open(path, 'rb') as handle:
+        header = handle.readline()
+    names = pd.read_csv(io.BytesIO(header), nrows = 0).columns.tolist()
+    return names, len(header)
+
+
+def byte_ranges(path, parts):
+    '''Split the body of `path` (after the header) into at most `parts` line-aligned (start, stop) ranges.'''
+    _, body_start = read_header(path)
+    size = os.path.getsize(path)
+    step = max((size - body_start) // max(parts, 1), 1)
+    ranges = []
+    start = body_start
+    with open(path, 'rb') as handle:
+        while start < size:
+            stop = min(start + step, size)
+            if stop < size:
+                # move the cut to just after the next newline
+                handle.seek(stop)
+                handle.readline()
+                stop = handle.tell()
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def aggregate_range(path, start, stop, names, columns = None, chunksize = DEFAULT_CHUNKSIZE):
+    '''Worker: aggregate the rows in bytes [start, stop) of `path`.'''
+    options = read_options(columns or AGGREGATE_COLUMNS)
+    with io.BufferedReader(_RangeReader(path, start, stop)) as handle:
+        reader = pd.read_csv(handle, header = None, names = names, chunksize = chunksize, **options)
+        return aggregate_chunks(iter_typed_chunks(reader))
+
+
+def aggregate_csv_parallel(path = DATA_FILE, workers = None, chunksize = DEFAULT_CHUNKSIZE):
+    '''Aggregate `path` across a process pool and return the merged RegistrationAggregator.'''
+    workers = workers or os.cpu_count() or 1
+    names, _ = read_header(path)
+    ranges = byte_ranges(path, workers * RANGES_PER_WORKER)
+    merged = RegistrationAggregator()
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(aggregate_range, path, start, stop, names, None, chunksize) for start, stop in ranges]
+        for future in futures:
+            merged.merge(future.result())
+    return merged
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    start = time.perf_counter()
+    reports = aggregate_csv_parallel(path, workers).reports()
+    print(f'aggregated in {time.perf_counter() - start:.2f}s')
+    print(reports['Distribution'])
+    print(reports['Top_models'])
@@ -0,0 +1,75 @@
+#EV.py as a sequence of named, instrumented stages
+
+'''The notebook cells of EV.py run as one flat script, so a slow nightly run gives no hint of where the time went.
+run_pipeline() runs the same work as named stages (load, clean, aggregate, forecast, render) through a Tracer:
+
+    python ev_pipeline.py [csv] [--out report] [--trace trace.json] [--profile forecast] [--memory load]
+
+--profile and --memory take comma separated stage names to run under cProfile / tracemalloc.'''
+
+import argparse
+
+from ev_aggregate import RegistrationAggregator
+from ev_clean import LazyCleaner
+from ev_forecast import Forecaster, forecast_table
+from ev_loader import ANALYSIS_COLUMNS, DATA_FILE, load_registrations
+from ev_trace import NO_TRACE, Tracer
+
+
+STAGES = ['load', 'clean', 'aggregate', 'forecast', 'render']
+
+
+def run_pipeline(path = DATA_FILE, out_dir = 'report', tracer = NO_TRACE, forecaster = None):
+    '''Run every stage and return the report tables.'''
+    with tracer.stage('load') as stage:
+        EVdata = load_registrations(path, ANALYSIS_COLUMNS)
+        stage.rows = len(EVdata)
+
+    with tracer.stage('clean') as stage:
+        # no dropna copy: null bitmaps per column, each aggregation skips only rows missing its own columns
+        Analysis_rows = LazyCleaner(EVdata).analysis_report()
+        stage.rows = len(EVdata)
+
+    with tracer.stage('aggregate', len(EVdata)):
+        tables = RegistrationAggregator().update(EVdata).reports()
+        tables['Analysis_rows'] = Analysis_rows
+        del EVdata
+
+    with tracer.stage('forecast') as stage:
+        tables['Forecast'] = forecast_table(tables['EV_registration_counts'], forecaster or Forecaster())
+        stage.rows = len(tables['Forecast'])
+
+    with tracer.stage('render') as stage:
+        # matplotlib and seaborn are imported here, so their import time is part of the render stage
+        from ev_report import figure_tables, render_report
+        tables = figure_tables(tables)
+        render_report(tables, out_dir)
+        stage.rows = len(tables)
+    return tables
+
+
+def _stage_list(value):
+    names = [name for name in (value or '').split(',') if name]
+    unknown = set(names) - set(STAGES)
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown stages {sorted(unknown)}, expected {STAGES}')
+    return names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run the EV analysis as instrumented stages')
+    parser.add_argument('csv', nargs = '?', default = DATA_FILE)
+    parser.add_argument('--out', default = 'report')
+    parser.add_argument('--trace', default = 'trace.json', help = 'where to write the JSON trace')
+    parser.add_argument('--no-trace', action = 'store_true')
+    parser.add_argument('--profile', type = _stage_list, default = [], help = 'stages to run under cProfile')
+    parser.add_argument('--memory', type = _stage_list, default = [], help = 'stages to run under tracemalloc')
+    args = parser.parse_args()
+
+    tracer = Tracer(enabled = not args.no_trace, profile_stages = args.profile, memory_stages = args.memory)
+    run_pipeline(args.csv, args.out, tracer)
+    if tracer.enabled:
+        tracer.write(args.trace)
+        for record in tracer.records:
+            print(f'{record.name:<10} {record.wall_seconds:8.3f}s wall {record.cpu_seconds:8.3f}s cpu '
+                  f'{record.peak_rss_delta_mb:8.1f} MB rss  rows={record.rows}')
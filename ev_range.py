@@ -0,0 +1,124 @@
+#Compact, mergeable summary of the Electric Range distribution
+
+'''The range cell in EV.py hands the full 1M row Electric Range column to sns.histplot (which also runs a KDE over
+every row) and computes its mean twice. Electric Range is a whole number of miles, so the distribution is fully
+described by one count per mile: RangeSummary keeps those counts plus running count / sum / sum of squares, which
+can be filled chunk by chunk, merged, and cached with the other aggregates.
+
+The 20 bin histogram is re-binned from the per-mile counts, and the KDE is a binned Gaussian KDE evaluated by FFT
+convolution on the one mile grid, so the figure costs milliseconds and never needs the raw column.'''
+
+import numpy as np
+import pandas as pd
+
+
+# KDE bandwidth in miles when Scott's rule has no spread to scale (one vehicle, or every range the same)
+FALLBACK_BANDWIDTH = 1.0
+
+
+class RangeSummary:
+    '''Per-mile counts and running moments of Electric Range.'''
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype = np.int64)
+        self.n = 0
+        self.total = 0
+        self.total_sq = 0
+
+    @classmethod
+    def from_values(cls, values):
+        return cls().update(values)
+
+    @classmethod
+    def from_counts(cls, counts):
+        '''Build a summary from a Series of counts indexed by range in miles.'''
+        summary = cls()
+        miles = np.asarray(counts.index, dtype = np.int64)
+        weights = np.asarray(counts.values, dtype = np.int64)
+        summary._add_counts(np.bincount(miles, weights = weights).astype(np.int64))
+        return summary
+
+    def _add_counts(self, counts):
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts[:len(counts)] += counts
+        miles = np.arange(len(counts), dtype = np.int64)
+        self.n += int(counts.sum())
+        self.total += int(counts @ miles)
+        self.total_sq += int(counts @ (miles * miles))
+
+    def update(self, values):
+        '''Fold a column (or chunk of a column) of ranges into the summary, missing values are ignored.'''
+        values = np.asarray(values.dropna() if hasattr(values, 'dropna') else values, dtype = np.int64)
+        if len(values) and values.min() < 0:
+            raise ValueError('Electric Range cannot be negative')
+        self._add_counts(np.bincount(values))
+        return self
+
+    def merge(self, other):
+        self._add_counts(other.counts)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float('nan')
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return float('nan')
+        return float(np.sqrt((self.total_sq - self.total * self.total / self.n) / (self.n - 1)))
+
+    @property
+    def value_range(self):
+        observed = np.flatnonzero(self.counts)
+        if not len(observed):
+            raise ValueError('the range summary is empty')
+        return int(observed[0]), int(observed[-1])
+
+    def histogram(self, bins = 20):
+        '''(counts, edges) of `bins` equal-width bins spanning the observed range, as np.histogram would give.'''
+        low, high = self.value_range
+        miles = np.arange(low, high + 1)
+        return np.histogram(miles, bins = bins, range = (low, high), weights = self.counts[low:high + 1])
+
+    def kde(self, bandwidth = None):
+        '''Binned Gaussian KDE on the one mile grid as (miles, density).
+
+        The default bandwidth is Scott's rule, the default of gaussian_kde (which seaborn uses), or
+        FALLBACK_BANDWIDTH when the standard deviation is undefined or 0.'''
+        low, high = self.value_range
+        if bandwidth is None:
+            std = self.std
+            bandwidth = std * self.n ** (-1 / 5) if np.isfinite(std) and std > 0 else FALLBACK_BANDWIDTH
+        bandwidth = max(bandwidth, 1e-3)
+        radius = int(np.ceil(4 * bandwidth))
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+        kernel /= kernel.sum()
+        grid_counts = self.counts[low:high + 1].astype(float)
+        size = len(grid_counts) + len(kernel) - 1
+        smoothed = np.fft.irfft(np.fft.rfft(grid_counts, size) * np.fft.rfft(kernel, size), size)
+        # keep the part of the full convolution aligned with the observed miles
+        density = np.clip(smoothed[radius:radius + len(grid_counts)], 0, None) / self.n
+        return np.arange(low, high + 1), density
+
+    def to_counts(self):
+        '''Non-zero per-mile counts as a Series, the form stored in the report tables.'''
+        miles = np.flatnonzero(self.counts)
+        return pd.Series(self.counts[miles], index = pd.Index(miles, name = 'Electric Range'), name = 'count')
+
+
+def plot_range_summary(summary, bins = 20, color = 'royalblue'):
+    '''The range histogram from EV.py, drawn from a RangeSummary on the current figure.'''
+    import matplotlib.pyplot as plt
+    counts, edges = summary.histogram(bins)
+    plt.bar(edges[:-1], counts, width = np.diff(edges), align = 'edge', color = color, alpha = 0.5, edgecolor = 'black')
+    miles, density = summary.kde()
+    # scale the density to vehicles per histogram bin, like seaborn's kde=True line
+    plt.plot(miles, density * summary.n * np.diff(edges)[0], color = color)
+    plt.title('Distribution of Electric Vehicle Ranges')
+    plt.xlabel("Electric Range(miles)")
+    plt.ylabel("Number of vehicles")
+    plt.axvline(summary.mean, color = 'red', linestyle ='--', label = f'Mean Range: {summary.mean:.2f} miles')
+    plt.legend()
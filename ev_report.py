@@ -0,0 +1,211 @@
+#Headless batch report: every EV.py figure rendered to files on the Agg backend
+
+'''EV.py draws its nine figures with plt.show(), which blocks and needs a display. render_report() draws the same
+figures from the aggregated tables without a display, writes them as PNG / SVG next to the tables (as CSV), and
+renders independent figures in parallel worker processes.
+
+A manifest in the output directory records a hash of the tables behind each figure; a figure whose input tables
+hash the same as last run is skipped.'''
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from ev_aggregate import aggregate_csv
+from ev_forecast import REPORT_SEED, forecast_table
+from ev_loader import DATA_FILE
+from ev_range import RangeSummary, plot_range_summary
+
+
+MANIFEST = 'report_manifest.json'
+FORMATS = ('png', 'svg')
+
+
+def adoption_over_time(tables):
+    EV_adoption_by_year = tables['EV_adoption_by_year']
+    plt.figure(figsize = (10,8))
+    sns.barplot(x = EV_adoption_by_year.index, y = EV_adoption_by_year.values, hue = EV_adoption_by_year.index,
+                palette = 'viridis', legend = False)
+    plt.xlabel("Year")
+    plt.ylabel("Number of vehicles registered")
+    plt.title('EV Adoption Over Time')
+    plt.xticks(rotation = 45)
+
+
+def top_cities(tables):
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x='City', y='Count', hue = 'County',data = tables['Distribution'], palette='viridis')
+    plt.xlabel('City')
+    plt.ylabel('Count')
+    plt.title("Top 10 Cities with the Highest Number of EV's")
+    plt.xticks(rotation=45)
+
+
+def vehicle_types(tables):
+    Vehicle_type = tables['Vehicle_type']
+    plt.figure(figsize=(10, 6))
+    plt.pie(Vehicle_type, labels= Vehicle_type.index, autopct='%1.1f%%', startangle= 130)
+    plt.title('Vehicle types')
+
+
+def top_manufacturers(tables):
+    Top_manufacturers = tables['Top_manufacturers']
+    plt.figure(figsize = (10,6))
+    sns.barplot(x = Top_manufacturers.values, y = Top_manufacturers.index, hue = Top_manufacturers.index,
+                palette = "cubehelix", legend = False)
+    plt.title('Top 10 popular manufacturers')
+    plt.xlabel("Number of Vehicles Registered")
+    plt.ylabel("Make")
+    plt.tight_layout()
+
+
+def top_models(tables):
+    plt.figure(figsize = (12,8))
+    sns.barplot(x = 'Count', y = 'Model', hue = 'Make',data = tables['Top_models'], palette = "viridis")
+    plt.xlabel('Number of vehicles registered')
+    plt.ylabel('Model')
+    plt.title('Top models by top 5 manufacturers')
+
+
+def range_distribution(tables):
+    plt.figure(figsize =(12,6))
+    plot_range_summary(RangeSummary.from_counts(tables['Range_counts']))
+
+
+def average_range_by_year(tables):
+    plt.figure(figsize = (12,8))
+    sns.lineplot(x = 'Model Year', y = 'Avg_range', data = tables['Avg_EV_range'], marker = 'o', color = 'Green')
+    plt.xlabel('Model Year')
+    plt.ylabel('Average EV range(miles)')
+    plt.title('Average EV Range by Model year')
+
+
+def top_range_models(tables):
+    plt.figure(figsize = (10,6))
+    sns.barplot(x = 'Range in miles' , y = 'Model', hue = 'Make',data = tables['Top_range_models'], palette = "cool" )
+    plt.xlabel("Range (miles)")
+    plt.ylabel("Model name")
+    plt.title('Top range EV Models by Top Manufacturers')
+
+
+def market_size_forecast(tables):
+    forecast = tables['Forecast']
+    actual = forecast['actual'].dropna()
+    predicted = forecast['forecast'].dropna()
+    plt.figure(figsize = (12,6))
+    plt.plot(actual.index, actual.values, 'bo-', label = 'Actual Registrations')
+    plt.plot(predicted.index, predicted.values, 'ro--', label = 'Forecasted Registrations')
+    if forecast['lower'].notna().any():
+        band = forecast.dropna(subset = ['lower', 'upper'])
+        plt.fill_between(band.index, band['lower'], band['upper'], color = 'red', alpha = 0.2,
+                         label = '95% prediction interval')
+    plt.title('Current and estimated EV market size')
+    plt.xlabel("Year")
+    plt.ylabel("Number of registrations")
+    plt.legend()
+    plt.grid(True)
+
+
+# figure name -> (draw function, tables it reads)
+FIGURES = {
+    'ev_adoption_over_time': (adoption_over_time, ['EV_adoption_by_year']),
+    'top_10_cities': (top_cities, ['Distribution']),
+    'vehicle_types': (vehicle_types, ['Vehicle_type']),
+    'top_10_manufacturers': (top_manufacturers, ['Top_manufacturers']),
+    'top_models': (top_models, ['Top_models']),
+    'range_distribution': (range_distribution, ['Range_counts']),
+    'average_range_by_year': (average_range_by_year, ['Avg_EV_range']),
+    'top_range_models': (top_range_models, ['Top_range_models']),
+    'market_size_forecast': (market_size_forecast, ['Forecast']),
+}
+
+
+def figure_tables(tables):
+    '''The subset of `tables` the figures read.'''
+    needed = {name for _, names in FIGURES.values() for name in names}
+    return {name: table for name, table in tables.items() if name in needed}
+
+
+def build_tables(aggregator, forecaster = None, seed = REPORT_SEED):
+    '''Every table a figure reads, from a filled RegistrationAggregator. `seed` fixes the bootstrap interval, so
+    unchanged counts hash the same and the forecast figure is not re-rendered.'''
+    tables = aggregator.reports()
+    tables['Forecast'] = forecast_table(tables['EV_registration_counts'], forecaster, seed = seed)
+    return figure_tables(tables)
+
+
+def table_hash(tables, names):
+    digest = hashlib.blake2b(digest_size = 16)
+    for name in names:
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(tables[name], index = True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _render(name, tables, out_dir, formats):
+    draw, _ = FIGURES[name]
+    draw(tables)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        plt.savefig(path, bbox_inches = 'tight')
+        paths.append(path)
+    plt.close('all')
+    return paths
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_report(tables, out_dir, formats = FORMATS, workers = None, force = False, figures = None):
+    '''Write the tables as CSV and render every figure (or only `figures`) whose input tables changed since the
+    last run.
+
+    Returns {figure name: 'rendered' | 'unchanged'}.'''
+    os.makedirs(out_dir, exist_ok = True)
+    for name, table in tables.items():
+        table.to_csv(os.path.join(out_dir, f'{name}.csv'))
+
+    figures = list(FIGURES if figures is None else figures)
+    manifest = _read_manifest(out_dir)
+    hashes = {name: table_hash(tables, FIGURES[name][1]) for name in figures}
+    stale = [name for name in figures
+             if force or manifest.get(name) != hashes[name]
+             or not all(os.path.exists(os.path.join(out_dir, f'{name}.{fmt}')) for fmt in formats)]
+
+    workers = min(workers or os.cpu_count() or 1, len(stale)) if stale else 0
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            futures = [pool.submit(_render, name, {t: tables[t] for t in FIGURES[name][1]}, out_dir, formats)
+                       for name in stale]
+            for future in futures:
+                future.result()
+    else:
+        for name in stale:
+            _render(name, tables, out_dir, formats)
+
+    manifest.update({name: hashes[name] for name in stale})
+    with open(os.path.join(out_dir, MANIFEST), 'w') as handle:
+        json.dump(manifest, handle, indent = 2)
+    return {name: 'rendered' if name in stale else 'unchanged' for name in figures}
+
+
+if __name__ == '__main__':
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else 'report'
+    status = render_report(build_tables(aggregate_csv(path)), out_dir)
+    for name, state in status.items():
+        print(f'{name}: {state}')
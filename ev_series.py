@@ -0,0 +1,198 @@
+#Monthly and weekly registration / revenue series from Sale Date
+
+'''The adoption and forecast cells of EV.py count registrations per Model Year, which is only a proxy for when
+vehicles were registered, and drop the incomplete 2024 by hand (`< 2024`). The file also has the Sale Date and Sale
+Price of every registration.
+
+sale_days() turns Sale Date into int32 days since 1970-01-01. SalesSeries folds chunks of rows into per-month and
+per-week registration counts and revenue with np.bincount over those month / week numbers, shifted by the first
+month / week the series holds (so dates before 1970 count too and the arrays start at the first sale). It is kept by
+RegistrationAggregator, so the series come out of the same streaming pass, merge across parallel workers, and are
+extended from the appended rows only by ev_incremental.refresh when new months arrive.
+
+yearly_forecast() fits a Forecaster model to the complete months (x in fractional years) and fills every month
+still missing from a year with the model's prediction, so a partial year is completed by the fit instead of being
+cut off.'''
+
+import numpy as np
+import pandas as pd
+
+from ev_loader import SALE_DATE, SALE_PRICE, parse_sale_date
+
+
+MISSING_DAY = np.iinfo(np.int32).min
+# 1970-01-01 was a Thursday, weeks start on Monday: week w covers days 7 * w - 3 to 7 * w + 3
+WEEK_SHIFT = 3
+
+
+def sale_days(values):
+    '''Sale Date as int32 days since 1970-01-01, MISSING_DAY where it is missing. Strings are parsed first.'''
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = parse_sale_date(values)
+    dates = values.to_numpy(dtype = 'datetime64[D]')
+    days = dates.astype(np.int64)
+    days[np.isnat(dates)] = MISSING_DAY
+    return days.astype(np.int32)
+
+
+def month_of(days):
+    '''Months since January 1970 of int day numbers.'''
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def week_of(days):
+    '''Monday based weeks since the week of 1970-01-01 of int day numbers.'''
+    return (days.astype(np.int64) + WEEK_SHIFT) // 7
+
+
+def _add(total, origin, part, part_origin):
+    '''Add `part`, whose first entry is month / week `part_origin`, to `total`, whose first entry is `origin`,
+    padding `total` on either side to cover both. Returns the sum and its origin.'''
+    if origin is None:
+        return part.copy(), part_origin
+    start = min(origin, part_origin)
+    stop = max(origin + len(total), part_origin + len(part))
+    if start < origin or stop > origin + len(total):
+        total = np.pad(total, (origin - start, stop - origin - len(total)))
+    total[part_origin - start:part_origin - start + len(part)] += part
+    return total, start
+
+
+def month_years(index):
+    '''Fractional years (2024.0 for January, 2024 + 11/12 for December) of a monthly PeriodIndex.'''
+    return (index.year + (index.month - 1) / 12).to_numpy(dtype = float)
+
+
+class SalesSeries:
+    '''Registrations and revenue per month and per week of Sale Date. Entry i of the monthly arrays is month
+    month_origin + i (months since January 1970, negative before it), and likewise for the weekly arrays.'''
+
+    def __init__(self):
+        self.monthly_counts = np.zeros(0, dtype = np.int64)
+        self.monthly_revenue = np.zeros(0, dtype = np.float64)
+        self.weekly_counts = np.zeros(0, dtype = np.int64)
+        self.weekly_revenue = np.zeros(0, dtype = np.float64)
+        self.month_origin = None
+        self.week_origin = None
+        self.first_day = None
+        self.last_day = None
+        self.missing = 0
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls().update(frame)
+
+    def update(self, frame):
+        '''Fold the Sale Date (and Sale Price, when present) of a frame or chunk into the series.'''
+        days = sale_days(frame[SALE_DATE])
+        valid = days != MISSING_DAY
+        self.missing += int(len(days) - np.count_nonzero(valid))
+        days = days[valid]
+        if not len(days):
+            return self
+        if SALE_PRICE in frame.columns:
+            prices = frame[SALE_PRICE].to_numpy(dtype = np.float64, na_value = 0.0)[valid]
+        else:
+            prices = np.zeros(len(days))
+        first_day, last_day = int(days.min()), int(days.max())
+        # bincount needs non-negative numbers, so count from the chunk's first month / week
+        month_origin = int(month_of(np.array([first_day]))[0])
+        week_origin = int(week_of(np.array([first_day]))[0])
+        months = month_of(days) - month_origin
+        weeks = week_of(days) - week_origin
+        self._add_series(np.bincount(months), np.bincount(months, weights = prices), month_origin,
+                         np.bincount(weeks), np.bincount(weeks, weights = prices), week_origin)
+        self._extend_days(first_day, last_day)
+        return self
+
+    def _add_series(self, monthly_counts, monthly_revenue, month_origin, weekly_counts, weekly_revenue,
+                    week_origin):
+        self.monthly_counts, _ = _add(self.monthly_counts, self.month_origin, monthly_counts, month_origin)
+        self.monthly_revenue, self.month_origin = _add(self.monthly_revenue, self.month_origin, monthly_revenue,
+                                                       month_origin)
+        self.weekly_counts, _ = _add(self.weekly_counts, self.week_origin, weekly_counts, week_origin)
+        self.weekly_revenue, self.week_origin = _add(self.weekly_revenue, self.week_origin, weekly_revenue,
+                                                     week_origin)
+
+    def _extend_days(self, first_day, last_day):
+        self.first_day = first_day if self.first_day is None else min(self.first_day, first_day)
+        self.last_day = last_day if self.last_day is None else max(self.last_day, last_day)
+
+    def merge(self, other):
+        if other.first_day is None:
+            self.missing += other.missing
+            return self
+        self._add_series(other.monthly_counts, other.monthly_revenue, other.month_origin,
+                         other.weekly_counts, other.weekly_revenue, other.week_origin)
+        self.missing += other.missing
+        self._extend_days(other.first_day, other.last_day)
+        return self
+
+    @property
+    def last_complete_month(self):
+        '''Month number of the last month covered to its final day by the data.'''
+        last_month = int(month_of(np.array([self.last_day]))[0])
+        return last_month if int(month_of(np.array([self.last_day + 1]))[0]) > last_month else last_month - 1
+
+    def monthly(self, complete = False):
+        '''Registrations and revenue per month from the first to the last sale (or the last complete month).'''
+        if self.first_day is None:
+            return pd.DataFrame({'registrations': [], 'revenue': []}, index = pd.PeriodIndex([], freq = 'M'))
+        first = int(month_of(np.array([self.first_day]))[0])
+        last = self.last_complete_month if complete else int(month_of(np.array([self.last_day]))[0])
+        index = pd.period_range(pd.Period('1970-01', freq = 'M') + first, periods = max(last - first + 1, 0),
+                                freq = 'M', name = 'month')
+        start = first - self.month_origin
+        return pd.DataFrame({'registrations': self.monthly_counts[start:start + len(index)],
+                             'revenue': self.monthly_revenue[start:start + len(index)]}, index = index)
+
+    def weekly(self):
+        '''Registrations and revenue per week, indexed by the Monday the week starts on.'''
+        if self.first_day is None:
+            return pd.DataFrame({'registrations': [], 'revenue': []}, index = pd.DatetimeIndex([], name = 'week'))
+        first = int(week_of(np.array([self.first_day]))[0])
+        last = int(week_of(np.array([self.last_day]))[0])
+        starts = (np.arange(first, last + 1) * 7 - WEEK_SHIFT).astype('datetime64[D]')
+        start, stop = first - self.week_origin, last + 1 - self.week_origin
+        return pd.DataFrame({'registrations': self.weekly_counts[start:stop],
+                             'revenue': self.weekly_revenue[start:stop]},
+                            index = pd.DatetimeIndex(starts, name = 'week'))
+
+
+def yearly_forecast(sales, forecaster = None, horizon = None):
+    '''Registrations per calendar year from the monthly series: observed complete months plus the fitted model's
+    prediction for every month still missing from the first incomplete year and the `horizon` years from it.
+
+    Only `forecaster`'s model, options and horizon are used; its cutoff is replaced by the end of the last complete
+    month. The cagr model counts points as years, so it cannot be fitted to months.'''
+    # ev_forecast imports ev_aggregate, which keeps a SalesSeries
+    from ev_forecast import Forecaster
+    forecaster = forecaster or Forecaster()
+    if forecaster.model.name == 'cagr':
+        raise ValueError('the cagr model needs one point per year, use exponential or logistic for monthly series')
+    monthly = sales.monthly(complete = True)['registrations']
+    if len(monthly) < 2:
+        raise ValueError('the monthly forecast needs at least two complete months of Sale Date')
+    t = month_years(monthly.index)
+    cutoff = t[-1] + 1 / 12
+    monthly_forecaster = Forecaster(forecaster.model.name, cutoff = cutoff, horizon = forecaster.horizon,
+                                    **forecaster.options)
+    result = monthly_forecaster.fit(pd.Series(monthly.to_numpy(), index = t))
+
+    horizon = forecaster.horizon if horizon is None else horizon
+    start_year = monthly.index[-1].year + (1 if monthly.index[-1].month == 12 else 0)
+    years = np.arange(start_year, start_year + horizon)
+    month_t = years[:, None] + np.arange(12)[None, :] / 12
+    observed = np.zeros(month_t.shape)
+    # months of the first incomplete year that are already complete
+    done = monthly[monthly.index.year == start_year]
+    observed[0, done.index.month - 1] = done.to_numpy()
+    predicted = np.where(month_t < cutoff - 1e-9, observed, monthly_forecaster.predict(result, month_t))
+
+    by_year = monthly.groupby(monthly.index.year)
+    actual, months = by_year.sum(), by_year.size()
+    table = pd.DataFrame({'actual': actual.astype(float), 'observed_months': months})[actual.index < start_year]
+    future = pd.DataFrame({'actual': np.nan, 'forecast': predicted.sum(axis = 1), 'observed_months': 0}, index = years)
+    if horizon and len(done):
+        future.iloc[0, [0, 2]] = [float(done.sum()), len(done)]
+    return pd.concat([table, future])[['actual', 'forecast', 'observed_months']].rename_axis('year')
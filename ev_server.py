@@ -0,0 +1,286 @@
+#Long-running query service over the cached aggregates
+
+'''Answers EV.py's questions with other parameters (top N cities of a county, top models for any set of makes,
+average range for a vehicle type and year window) without re-running the script. The aggregates come from the
+incremental state (ev_incremental.refresh), are loaded once at startup and reshaped into per-key lookup tables,
+so a query is a dictionary lookup plus a small slice. Results are kept in an LRU cache.
+
+Use it as a Python API (QueryService) or over HTTP:
+
+    python ev_server.py serve [csv] [--port 8050]
+    GET /top-cities?county=King&n=10[&type=Battery Electric Vehicle (BEV)&from=2018&to=2023]
+    GET /top-models?make=TESLA&make=NISSAN&n=10
+    GET /avg-range?type=Battery Electric Vehicle (BEV)&from=2015&to=2020
+    GET /cache, GET /cache/clear
+
+    python ev_server.py loadtest [csv] [--url http://localhost:8050]
+
+reports p50 / p99 latency and throughput for a mix of random queries, once cold (caches cleared before every
+query) and once against the warm caches.'''
+
+import argparse
+import json
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import urlopen
+
+import numpy as np
+
+from ev_geo import GeoCube
+from ev_incremental import refresh
+from ev_loader import DATA_FILE
+
+
+CACHE_SIZE = 4096
+
+
+class QueryService:
+    '''Parameterized queries over a filled RegistrationAggregator.'''
+
+    def __init__(self, aggregator, cache_size = CACHE_SIZE):
+        # County / City x vehicle type x Model Year counts, any slice of it is a sum and a partial top-k
+        self.geo = GeoCube.from_aggregator(aggregator)
+        make_model = aggregator.count('make_model').sort_values(ascending = False)
+        # per make, (count, model) pairs already in descending order
+        self._models = {make: [(int(count), model) for (_, model), count in group.items()]
+                        for make, group in make_model.groupby(level = 0, sort = False)}
+        # (vehicle type, year) range counts and sums as one row per vehicle type, sorted by year
+        counts = aggregator.range_counts['vehicle_type_year']
+        sums = aggregator.range_sums['vehicle_type_year'].reindex(counts.index, fill_value = 0)
+        self._range = {}
+        for vehicle_type, group in counts.groupby(level = 0, sort = False):
+            years = group.index.get_level_values(1).to_numpy()
+            self._range[vehicle_type] = (years, np.cumsum(group.to_numpy()),
+                                         np.cumsum(sums.loc[group.index].to_numpy()))
+        self._top_cities_cached = lru_cache(maxsize = cache_size)(self._top_cities)
+        self._top_models_cached = lru_cache(maxsize = cache_size)(self._top_models)
+        self.avg_range = lru_cache(maxsize = cache_size)(self._avg_range)
+
+    @classmethod
+    def from_csv(cls, path = DATA_FILE, **options):
+        aggregator, _ = refresh(path)
+        return cls(aggregator, **options)
+
+    @property
+    def counties(self):
+        return list(self.geo.counties)
+
+    @property
+    def makes(self):
+        return list(self._models)
+
+    @property
+    def vehicle_types(self):
+        return list(self._range)
+
+    def _top_cities(self, county, n = 10, vehicle_type = None, year_from = None, year_to = None):
+        top = self.geo.top_cities(n, county, vehicle_type = vehicle_type, year_from = year_from, year_to = year_to)
+        return [{'City': city, 'Count': int(count)} for city, count in zip(top['City'], top['Count'])]
+
+    def top_cities(self, county, n = 10, vehicle_type = None, year_from = None, year_to = None):
+        '''Top `n` cities of `county`, optionally for one vehicle type and Model Year window.'''
+        _check_count(n)
+        return self._top_cities_cached(county, n, vehicle_type, year_from, year_to)
+
+    def _top_models(self, makes, n = 10):
+        # each make's list is sorted, so only its first n entries can make the overall top n
+        top = [(count, make, model) for make in makes if make in self._models
+               for count, model in self._models[make][:n]]
+        top.sort(key = lambda item: -item[0])
+        return [{'Make': make, 'Model': model, 'Count': count} for count, make, model in top[:n]]
+
+    def top_models(self, makes, n = 10):
+        '''Top `n` (Make, Model) pairs by registrations within `makes`.'''
+        _check_count(n)
+        return self._top_models_cached(tuple(sorted(set(makes))), n)
+
+    def _avg_range(self, vehicle_type, year_from = None, year_to = None):
+        if vehicle_type not in self._range:
+            return None
+        years, cumulative_counts, cumulative_sums = self._range[vehicle_type]
+        # prefix sums turn any year window into two lookups
+        start = 0 if year_from is None else int(np.searchsorted(years, year_from, side = 'left'))
+        stop = len(years) if year_to is None else int(np.searchsorted(years, year_to, side = 'right'))
+        if stop <= start:
+            return None
+        count = cumulative_counts[stop - 1] - (cumulative_counts[start - 1] if start else 0)
+        total = cumulative_sums[stop - 1] - (cumulative_sums[start - 1] if start else 0)
+        return float(total / count) if count else None
+
+    def cache_info(self):
+        return {
+            'top_cities': self._top_cities_cached.cache_info()._asdict(),
+            'top_models': self._top_models_cached.cache_info()._asdict(),
+            'avg_range': self.avg_range.cache_info()._asdict(),
+        }
+
+    def clear_caches(self):
+        for cached in (self._top_cities_cached, self._top_models_cached, self.avg_range):
+            cached.cache_clear()
+
+
+def _check_count(n):
+    if n < 0:
+        raise ValueError(f'n must be 0 or more, got {n}')
+
+
+def _int(params, name, default = None):
+    return int(params[name][0]) if name in params else default
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            try:
+                if url.path == '/top-cities':
+                    vehicle_type = params['type'][0] if 'type' in params else None
+                    result = service.top_cities(params['county'][0], _int(params, 'n', 10), vehicle_type,
+                                                _int(params, 'from'), _int(params, 'to'))
+                elif url.path == '/top-models':
+                    result = service.top_models(params.get('make', []), _int(params, 'n', 10))
+                elif url.path == '/avg-range':
+                    result = service.avg_range(params['type'][0], _int(params, 'from'), _int(params, 'to'))
+                elif url.path == '/cache':
+                    result = service.cache_info()
+                elif url.path == '/cache/clear':
+                    service.clear_caches()
+                    result = service.cache_info()
+                else:
+                    self.send_error(404)
+                    return
+            except (KeyError, ValueError) as error:
+                self.send_error(400, f'bad query: {error}')
+                return
+            body = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(service, host = '127.0.0.1', port = 8050):
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f'serving EV queries on http://{host}:{port}')
+    server.serve_forever()
+
+
+def random_queries(service, count, seed = 0):
+    '''A reproducible mix of the three query kinds over the known counties, makes and vehicle types.'''
+    rng = np.random.default_rng(seed)
+    queries = []
+    for kind in rng.integers(0, 3, count):
+        if kind == 0:
+            county = service.counties[rng.integers(len(service.counties))]
+            queries.append(('top_cities', (county, int(rng.integers(1, 20)))))
+        elif kind == 1:
+            size = min(int(rng.integers(1, 6)), len(service.makes))
+            makes = tuple(rng.choice(service.makes, size = size, replace = False))
+            queries.append(('top_models', (makes, int(rng.integers(1, 20)))))
+        else:
+            year_from = int(rng.integers(2000, 2024))
+            vehicle_type = service.vehicle_types[rng.integers(len(service.vehicle_types))]
+            queries.append(('avg_range', (vehicle_type, year_from, year_from + int(rng.integers(0, 10)))))
+    return queries
+
+
+def _http_call(url, kind, args):
+    if kind == 'top_cities':
+        query = {'county': args[0], 'n': args[1]}
+        path = '/top-cities'
+    elif kind == 'top_models':
+        query = [('make', make) for make in args[0]] + [('n', args[1])]
+        path = '/top-models'
+    else:
+        query = {'type': args[0], 'from': args[1], 'to': args[2]}
+        path = '/avg-range'
+    return _http_get(url, f'{path}?{urlencode(query)}')
+
+
+def _http_get(url, path):
+    with urlopen(f'{url}{path}') as response:
+        return json.load(response)
+
+
+def _latency_stats(latencies, elapsed):
+    return {
+        'queries': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'max_ms': round(float(latencies.max()) * 1000, 3),
+        'queries_per_second': round(len(latencies) / float(elapsed), 1),
+    }
+
+
+def _cache_hits(info):
+    return sum(entry['hits'] for entry in info.values()), sum(entry['misses'] for entry in info.values())
+
+
+def _call(service, url, kind, args):
+    if url is None:
+        return getattr(service, kind)(*args)
+    return _http_call(url, kind, args)
+
+
+def _run_queries(service, queries, url, cold):
+    latencies = np.empty(len(queries))
+    elapsed = 0.0
+    for i, (kind, args) in enumerate(queries):
+        if cold:
+            # untimed: every query then has to be computed from the aggregates
+            if url is None:
+                service.clear_caches()
+            else:
+                urlopen(f'{url}/cache/clear').close()
+        began = time.perf_counter()
+        _call(service, url, kind, args)
+        latencies[i] = time.perf_counter() - began
+        elapsed += latencies[i]
+    return _latency_stats(latencies, elapsed)
+
+
+def load_test(service, count = 10000, url = None, seed = 0):
+    '''Run `count` random queries against the Python API (or the HTTP server at `url`) and report latency twice:
+    cold, with the result caches cleared before every query, and cached, the same mix again after one untimed pass
+    over it has filled the LRU caches (with the share of cache hits), so the cached numbers are not mistaken for
+    query cost.'''
+    queries = random_queries(service, count, seed)
+    cache_info = service.cache_info if url is None else lambda: _http_get(url, '/cache')
+    cold = _run_queries(service, queries, url, cold = True)
+    # the cold pass leaves the caches nearly empty, fill them with the whole mix before timing it
+    for kind, args in queries:
+        _call(service, url, kind, args)
+    hits, misses = _cache_hits(cache_info())
+    cached = _run_queries(service, queries, url, cold = False)
+    new_hits, new_misses = _cache_hits(cache_info())
+    calls = (new_hits - hits) + (new_misses - misses)
+    cached['cache_hit_rate'] = round((new_hits - hits) / calls, 3) if calls else None
+    return {'cold': cold, 'cached': cached}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'EV registration query service')
+    parser.add_argument('command', choices = ['serve', 'loadtest'])
+    parser.add_argument('csv', nargs = '?', default = DATA_FILE)
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8050)
+    parser.add_argument('--url', help = 'load test a running server instead of the in-process API')
+    parser.add_argument('--queries', type = int, default = 10000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    service = QueryService.from_csv(args.csv)
+    print(f'aggregates loaded in {time.perf_counter() - started:.2f}s')
+    if args.command == 'serve':
+        serve(service, args.host, args.port)
+    else:
+        print(load_test(service, args.queries, args.url))
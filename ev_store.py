@@ -0,0 +1,127 @@
+#Dictionary-encoded registration store with prebuilt group indexes
+
+'''EV.py keeps regrouping the same few keys (Model Year, County, City, Make, Model, vehicle type), and
+EVdata[EVdata['Make'].isin(Top_5_manufacturers)] copies every matching row just to group them again.
+
+RegistrationStore keeps each key column as integer codes in a NumPy array next to its labels. Group indexes are
+CSR style: the row ids sorted by code plus an offsets array, so the rows of any group (or set of groups) are a
+slice lookup. Filters return row ids instead of a frame copy, and group counts / means are np.bincount calls over
+the codes of those rows.'''
+
+import numpy as np
+import pandas as pd
+
+from ev_loader import RANGE, VEHICLE_TYPE, YEAR
+
+
+KEY_COLUMNS = [YEAR, 'County', 'City', 'Make', 'Model', VEHICLE_TYPE]
+VALUE_COLUMNS = [RANGE]
+
+
+class GroupIndex:
+    '''Row ids of every group of a (possibly combined) key, in CSR form: rows[offsets[g]:offsets[g + 1]].'''
+
+    def __init__(self, codes, groups):
+        valid = codes >= 0
+        self.rows = np.flatnonzero(valid)[np.argsort(codes[valid], kind = 'stable')].astype(np.int64)
+        self.offsets = np.zeros(groups + 1, dtype = np.int64)
+        np.cumsum(np.bincount(codes[valid], minlength = groups), out = self.offsets[1:])
+
+    def group_rows(self, group):
+        return self.rows[self.offsets[group]:self.offsets[group + 1]]
+
+    def lookup(self, groups):
+        '''Row ids of all `groups`, in row order.'''
+        groups = np.asarray(groups, dtype = np.int64)
+        if len(groups) == 1:
+            return self.group_rows(groups[0])
+        return np.sort(np.concatenate([self.group_rows(group) for group in groups]))
+
+
+class RegistrationStore:
+    '''Key columns as integer codes with their labels, plus numeric value columns, all as NumPy arrays.'''
+
+    def __init__(self, codes, labels, values):
+        self.codes = codes
+        self.labels = labels
+        self.values = values
+        self.size = len(next(iter(codes.values())))
+        self._indexes = {}
+
+    @classmethod
+    def from_frame(cls, frame, keys = KEY_COLUMNS, value_columns = VALUE_COLUMNS):
+        codes = {}
+        labels = {}
+        for column in keys:
+            categorical = frame[column].astype('category').cat
+            codes[column] = categorical.codes.to_numpy().astype(np.int32)
+            labels[column] = categorical.categories
+        values = {column: frame[column].to_numpy(dtype = float, na_value = np.nan) for column in value_columns}
+        return cls(codes, labels, values)
+
+    def _combined(self, by, rows = None):
+        # one code per row for the key columns in `by`, -1 where any of them is missing
+        by = [by] if isinstance(by, str) else list(by)
+        sizes = [len(self.labels[column]) for column in by]
+        parts = [self.codes[column] if rows is None else self.codes[column][rows] for column in by]
+        if len(by) == 1:
+            return by, sizes, parts[0]
+        valid = np.logical_and.reduce([part >= 0 for part in parts])
+        combined = np.full(len(parts[0]), -1, dtype = np.int64)
+        combined[valid] = np.ravel_multi_index([part[valid] for part in parts], sizes)
+        return by, sizes, combined
+
+    def _labels(self, by, sizes, groups):
+        if len(by) == 1:
+            return self.labels[by[0]][groups].rename(by[0])
+        positions = np.unravel_index(groups, sizes)
+        return pd.MultiIndex.from_arrays([self.labels[column][position] for column, position in zip(by, positions)],
+                                         names = by)
+
+    def index(self, by):
+        '''The GroupIndex of a key column or tuple of key columns, built on first use and kept.'''
+        key = (by,) if isinstance(by, str) else tuple(by)
+        if key not in self._indexes:
+            _, sizes, codes = self._combined(key)
+            self._indexes[key] = GroupIndex(codes, int(np.prod(sizes)))
+        return self._indexes[key]
+
+    def build_indexes(self, keys = ('Make', ('County', 'City'))):
+        for by in keys:
+            self.index(by)
+        return self
+
+    def rows(self, by, values):
+        '''Row ids whose `by` key is one of `values` (labels, or label tuples for a combined key).'''
+        by_list = [by] if isinstance(by, str) else list(by)
+        if len(by_list) == 1:
+            groups = self.labels[by_list[0]].get_indexer(list(values))
+        else:
+            sizes = [len(self.labels[column]) for column in by_list]
+            positions = [self.labels[column].get_indexer([value[i] for value in values])
+                         for i, column in enumerate(by_list)]
+            found = np.logical_and.reduce([position >= 0 for position in positions])
+            groups = np.full(len(found), -1, dtype = np.int64)
+            groups[found] = np.ravel_multi_index([position[found] for position in positions], sizes)
+        groups = groups[groups >= 0]
+        if not len(groups):
+            return np.zeros(0, dtype = np.int64)
+        return self.index(by).lookup(groups)
+
+    def counts(self, by, rows = None):
+        '''Number of rows per group of `by`, only groups that occur; the bincount version of groupby(...).size().'''
+        by, sizes, codes = self._combined(by, rows)
+        counts = np.bincount(codes[codes >= 0], minlength = int(np.prod(sizes)))
+        groups = np.flatnonzero(counts)
+        return pd.Series(counts[groups], index = self._labels(by, sizes, groups))
+
+    def mean(self, column, by, rows = None):
+        '''Mean of a value column per group of `by`, the bincount version of groupby(by)[column].mean().'''
+        by, sizes, codes = self._combined(by, rows)
+        values = self.values[column] if rows is None else self.values[column][rows]
+        valid = (codes >= 0) & ~np.isnan(values)
+        groups_total = int(np.prod(sizes))
+        counts = np.bincount(codes[valid], minlength = groups_total)
+        sums = np.bincount(codes[valid], weights = values[valid], minlength = groups_total)
+        groups = np.flatnonzero(counts)
+        return pd.Series(sums[groups] / counts[groups], index = self._labels(by, sizes, groups), name = column)
@@ -0,0 +1,166 @@
+#Synthetic Electric Vehicle Title and Registration Activity data for benchmarks
+
+'''The real Data.gov file is needed to run EV.py at all, so there was no way to measure performance at larger sizes.
+generate() writes a CSV with the same columns and roughly the same shape as the real export:
+
+* Make / Model skewed towards TESLA, then NISSAN, CHEVROLET, FORD, BMW, KIA, TOYOTA, VOLKSWAGEN, HYUNDAI, JEEP
+* County concentrated in King, with the larger cities of each county
+* Model Year growing exponentially up to 2023, with a partial 2024
+* Electric Range per model, with the 0 mile ranges the real data reports for many recent BEVs
+* a small share of missing values, so the dropna cleaning step has work to do
+
+Rows are generated and written in blocks, so even the 50M row file never has to fit in memory.'''
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+SIZES = {'1m': 1_000_000, '10m': 10_000_000, '50m': 50_000_000}
+BLOCK_ROWS = 1_000_000
+
+BEV = 'Battery Electric Vehicle (BEV)'
+PHEV = 'Plug-in Hybrid Electric Vehicle (PHEV)'
+HPV = 'Hydrogen Powered Vehicle (HPV)'
+
+# make -> (share of registrations, [(model, vehicle type, electric range, share within the make)])
+MAKES = {
+    'TESLA': (0.42, [('MODEL Y', BEV, 291, 0.36), ('MODEL 3', BEV, 220, 0.38), ('MODEL S', BEV, 265, 0.14),
+                     ('MODEL X', BEV, 238, 0.11), ('ROADSTER', BEV, 245, 0.01)]),
+    'NISSAN': (0.09, [('LEAF', BEV, 84, 0.97), ('ARIYA', BEV, 0, 0.03)]),
+    'CHEVROLET': (0.08, [('BOLT EV', BEV, 238, 0.55), ('VOLT', PHEV, 38, 0.42), ('SPARK', BEV, 82, 0.02),
+                         ('S-10 PICKUP', BEV, 45, 0.01)]),
+    'FORD': (0.06, [('MUSTANG MACH-E', BEV, 0, 0.4), ('F-150', BEV, 0, 0.25), ('FUSION', PHEV, 19, 0.25),
+                    ('C-MAX', PHEV, 19, 0.1)]),
+    'BMW': (0.05, [('I3', BEV, 81, 0.35), ('X5', PHEV, 30, 0.35), ('330E', PHEV, 14, 0.3)]),
+    'KIA': (0.05, [('NIRO', BEV, 239, 0.5), ('EV6', BEV, 0, 0.35), ('SOUL EV', BEV, 93, 0.15)]),
+    'TOYOTA': (0.05, [('PRIUS PRIME', PHEV, 25, 0.5), ('RAV4 PRIME', PHEV, 42, 0.4), ('MIRAI', HPV, 0, 0.1)]),
+    'VOLKSWAGEN': (0.04, [('ID.4', BEV, 0, 0.8), ('E-GOLF', BEV, 83, 0.2)]),
+    'HYUNDAI': (0.04, [('IONIQ 5', BEV, 0, 0.7), ('KONA ELECTRIC', BEV, 258, 0.3)]),
+    'JEEP': (0.03, [('WRANGLER', PHEV, 21, 0.7), ('GRAND CHEROKEE', PHEV, 25, 0.3)]),
+    'AUDI': (0.03, [('E-TRON', BEV, 204, 0.6), ('Q5 E', PHEV, 18, 0.4)]),
+    'VOLVO': (0.03, [('XC90', PHEV, 18, 0.6), ('XC40', BEV, 0, 0.4)]),
+    'RIVIAN': (0.03, [('R1S', BEV, 0, 0.5), ('R1T', BEV, 0, 0.5)]),
+}
+
+# county -> (share of registrations, [cities])
+COUNTIES = {
+    'King': (0.50, ['Seattle', 'Bellevue', 'Redmond', 'Kirkland', 'Sammamish', 'Renton', 'Kent', 'Bothell']),
+    'Snohomish': (0.12, ['Bothell', 'Everett', 'Lynnwood', 'Edmonds', 'Mukilteo']),
+    'Pierce': (0.08, ['Tacoma', 'Gig Harbor', 'Puyallup', 'Lakewood']),
+    'Clark': (0.06, ['Vancouver', 'Camas', 'Battle Ground']),
+    'Thurston': (0.04, ['Olympia', 'Lacey', 'Tumwater']),
+    'Kitsap': (0.04, ['Bainbridge Island', 'Bremerton', 'Poulsbo']),
+    'Spokane': (0.03, ['Spokane', 'Spokane Valley']),
+    'Whatcom': (0.03, ['Bellingham', 'Ferndale']),
+    'Benton': (0.02, ['Richland', 'Kennewick']),
+    'Skagit': (0.02, ['Mount Vernon', 'Anacortes']),
+    'Island': (0.02, ['Oak Harbor', 'Langley']),
+    'Clallam': (0.02, ['Port Angeles', 'Sequim']),
+    'San Juan': (0.02, ['Friday Harbor', 'Eastsound']),
+}
+
+# registrations per Model Year grow roughly exponentially, 2024 only covers January to March
+FIRST_YEAR = 1997
+LAST_YEAR = 2024
+GROWTH = 0.35
+PARTIAL_LAST_YEAR = 0.12
+
+MISSING_SHARE = 0.0005
+COLUMNS = ['Clean Alternative Fuel Vehicle Type', 'VIN (1-10)', 'DOL Vehicle ID', 'Model Year', 'Make', 'Model',
+           'Vehicle Primary Use', 'Electric Range', 'Odometer Reading', 'New or Used Vehicle', 'Sale Price',
+           'Sale Date', 'Transaction Type', 'County', 'City', 'State of Residence', 'Postal Code']
+
+
+def _tables():
+    models = []
+    for make, (make_share, make_models) in MAKES.items():
+        for model, vehicle_type, electric_range, share in make_models:
+            models.append((make, model, vehicle_type, electric_range, make_share * share))
+    cities = []
+    for county, (county_share, county_cities) in COUNTIES.items():
+        # the first city of each county is its largest
+        weights = np.array([2.0 ** -i for i in range(len(county_cities))])
+        weights /= weights.sum()
+        cities.extend((county, city, county_share * weight) for city, weight in zip(county_cities, weights))
+    years = np.arange(FIRST_YEAR, LAST_YEAR + 1)
+    year_weights = np.exp(GROWTH * (years - LAST_YEAR))
+    year_weights[-1] *= PARTIAL_LAST_YEAR
+    return models, cities, years, year_weights / year_weights.sum()
+
+
+def generate_block(rows, rng, first_id = 0):
+    '''One block of synthetic registration rows as a DataFrame.'''
+    models, cities, years, year_weights = _tables()
+    model_share = np.array([model[4] for model in models])
+    model_pick = rng.choice(len(models), size = rows, p = model_share / model_share.sum())
+    city_share = np.array([city[2] for city in cities])
+    city_pick = rng.choice(len(cities), size = rows, p = city_share / city_share.sum())
+    model_year = rng.choice(years, size = rows, p = year_weights)
+
+    makes = np.array([model[0] for model in models], dtype = object)
+    names = np.array([model[1] for model in models], dtype = object)
+    types = np.array([model[2] for model in models], dtype = object)
+    base_range = np.array([model[3] for model in models])
+    electric_range = base_range[model_pick] * rng.uniform(0.85, 1.1, rows)
+    # the real data reports 0 miles for most recent BEVs whose range has not been researched
+    unknown = (types[model_pick] == BEV) & (model_year >= 2020) & (rng.random(rows) < 0.7)
+    electric_range = np.where(unknown, 0, np.round(electric_range)).astype(float)
+
+    sale_day = (pd.to_datetime(model_year.astype(str)) - pd.Timestamp('1970-01-01')).days.to_numpy()
+    sale_day = sale_day + rng.integers(-180, 365, rows)
+    sale_day = np.minimum(sale_day, (pd.Timestamp('2024-03-31') - pd.Timestamp('1970-01-01')).days)
+    first_day = sale_day.min()
+    labels = pd.date_range(pd.Timestamp('1970-01-01') + pd.Timedelta(days = int(first_day)),
+                           periods = int(sale_day.max() - first_day) + 1).strftime('%B %d %Y').to_numpy()
+    sale_date = labels[sale_day - first_day]
+    sale_price = np.where(rng.random(rows) < 0.6, 0, np.round(rng.normal(48000, 15000, rows).clip(5000)))
+
+    frame = pd.DataFrame({
+        'Clean Alternative Fuel Vehicle Type': types[model_pick],
+        'VIN (1-10)': '5YJ3E1EA0K',
+        'DOL Vehicle ID': np.arange(first_id, first_id + rows),
+        'Model Year': model_year,
+        'Make': makes[model_pick],
+        'Model': names[model_pick],
+        'Vehicle Primary Use': np.where(rng.random(rows) < 0.98, 'Passenger', 'Truck'),
+        'Electric Range': electric_range,
+        'Odometer Reading': rng.integers(0, 60000, rows),
+        'New or Used Vehicle': np.where(rng.random(rows) < 0.7, 'New', 'Used'),
+        'Sale Price': sale_price,
+        'Sale Date': sale_date,
+        'Transaction Type': 'Original Title',
+        'County': np.array([city[0] for city in cities], dtype = object)[city_pick],
+        'City': np.array([city[1] for city in cities], dtype = object)[city_pick],
+        'State of Residence': 'WA',
+        'Postal Code': rng.integers(98001, 99403, rows),
+    }, columns = COLUMNS)
+    for column in ['Electric Range', 'County', 'City']:
+        frame.loc[rng.random(rows) < MISSING_SHARE, column] = None
+    return frame
+
+
+def generate(path, rows, seed = 0, block_rows = BLOCK_ROWS):
+    '''Write `rows` synthetic registrations to `path`, one block at a time.'''
+    rng = np.random.default_rng(seed)
+    written = 0
+    with open(path, 'w', newline = '') as handle:
+        while written < rows:
+            block = generate_block(min(block_rows, rows - written), rng, written)
+            block.to_csv(handle, header = written == 0, index = False)
+            written += len(block)
+    return path
+
+
+def synthetic_path(size, directory = 'synthetic'):
+    return os.path.join(directory, f'ev_registrations_{size}.csv')
+
+
+if __name__ == '__main__':
+    sizes = sys.argv[1:] or list(SIZES)
+    for size in sizes:
+        os.makedirs('synthetic', exist_ok = True)
+        path = generate(synthetic_path(size), SIZES[size])
+        print(f'wrote {SIZES[size]} rows to {path}')
@@ -0,0 +1,147 @@
+#Per-stage instrumentation for the analysis pipeline
+
+'''A Tracer records, for every named stage, wall time, CPU time, the growth of the process peak RSS and the number
+of rows the stage handled, and writes them as a JSON trace. Chosen stages can additionally be run under cProfile
+(top functions by cumulative time are added to the trace) or tracemalloc (exact peak of Python / NumPy
+allocations).
+
+With enabled=False, stage() hands back one shared do-nothing context manager, so leaving the calls in the
+pipeline costs a method call per stage.'''
+
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+from ev_loader import peak_rss_mb
+
+
+PROFILE_TOP = 25
+
+
+class StageRecord:
+    '''Measurements of one stage; set `rows` inside the with block to record how much data it handled.'''
+
+    def __init__(self, name, rows = None):
+        self.name = name
+        self.rows = rows
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_delta_mb = None
+        self.traced_peak_mb = None
+        self.profile = None
+
+    def as_dict(self):
+        record = {
+            'stage': self.name,
+            'rows': self.rows,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_delta_mb': self.peak_rss_delta_mb,
+        }
+        if self.traced_peak_mb is not None:
+            record['traced_peak_mb'] = self.traced_peak_mb
+        if self.profile is not None:
+            record['profile'] = self.profile
+        return record
+
+
+class _NullStage:
+    # one instance is shared by every untraced stage, so it keeps no state and setting rows does nothing
+    __slots__ = ()
+
+    @property
+    def rows(self):
+        return None
+
+    @rows.setter
+    def rows(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, tracer, record):
+        self.tracer = tracer
+        self.record = record
+        self.profiler = None
+
+    def __enter__(self):
+        name = self.record.name
+        if name in self.tracer.memory_stages:
+            tracemalloc.start()
+        if name in self.tracer.profile_stages:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.rss = peak_rss_mb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        record = self.record
+        record.wall_seconds = round(time.perf_counter() - self.wall, 6)
+        record.cpu_seconds = round(time.process_time() - self.cpu, 6)
+        record.peak_rss_delta_mb = round(peak_rss_mb() - self.rss, 2)
+        if self.profiler is not None:
+            self.profiler.disable()
+            record.profile = _profile_summary(self.profiler)
+        if record.name in self.tracer.memory_stages:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record.traced_peak_mb = round(peak / (1024 * 1024), 2)
+        self.tracer.records.append(record)
+        return False
+
+
+def _profile_summary(profiler):
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream = output)
+    stats.sort_stats('cumulative')
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+            stats.stats.items(), key = lambda item: -item[1][3])[:PROFILE_TOP]:
+        rows.append({'function': f'{filename}:{line}({function})', 'calls': calls,
+                     'own_seconds': round(own, 6), 'cumulative_seconds': round(cumulative, 6)})
+    return rows
+
+
+class Tracer:
+    '''Collects StageRecords. `profile_stages` / `memory_stages` name the stages to run under cProfile /
+    tracemalloc.'''
+
+    def __init__(self, enabled = True, profile_stages = (), memory_stages = ()):
+        self.enabled = enabled
+        self.profile_stages = set(profile_stages)
+        self.memory_stages = set(memory_stages)
+        self.records = []
+
+    def stage(self, name, rows = None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, StageRecord(name, rows))
+
+    def as_dict(self):
+        return {
+            'stages': [record.as_dict() for record in self.records],
+            'total_wall_seconds': round(sum(record.wall_seconds for record in self.records), 6),
+        }
+
+    def write(self, path):
+        with open(path, 'w') as handle:
+            json.dump(self.as_dict(), handle, indent = 2)
+        return path
+
+
+# shared disabled tracer for code paths that are not being traced
+NO_TRACE = Tracer(enabled = False)